@@ -1,6 +1,5 @@
 import os
 from os.path import join as pjoin
-import re
 
 import ccg.lexicon
 
@@ -76,9 +75,8 @@ class AutoFileWriter:
         #    print leaf
         #    print leaf.stag
         #    raise StandardError
-        annot_strip_re = re.compile(r'<\d>|\*')
-        stag_str = annot_strip_re.sub('', leaf.stag.annotated)
-        stag_str += '@%s' % leaf.stag.srl_string()
+        # Shared between leaves with the same supertag and roles
+        stag_str = leaf.stag.srl_annotated()
         properties = [
             leaf.stag.string,
             leaf.pos,
@@ -5,7 +5,8 @@ import re
 
 from ._File import File
 from ._CCGNode import CCGNode
-from ._CCGSentence import CCGSentence
+from ._CCGSentence import CCGSentence, stripLeafCat
+import ccg.category
 
 class CCGFile(File, CCGNode):
     mmRE = re.compile(r'(?<=[/\\])[\.]')
@@ -20,6 +21,8 @@ class CCGFile(File, CCGNode):
         text = self.mmRE.sub('', text)
         # Sometimes sentences start (( instead of ( (. This is an error, correct it
         filename = path.split('/')[-1]
+        self.lexicon = kwargs.pop('lexicon', None)
+        self.arena = kwargs.pop('arena', False)
         self.path = path
         self.filename = filename
         self.ID = filename
@@ -29,12 +32,29 @@ class CCGFile(File, CCGNode):
 
     def _parseFile(self, text):
         lines = text.strip().split('\n')
+        categories = self._parseCategories(lines[1::2])
         while lines:
             idLine = lines.pop(0)
             sentence = lines.pop(0)
-            self._addSentence(idLine, sentence)
+            self._addSentence(idLine, sentence, categories)
 
-    def _addSentence(self, idLine, sentStr):
+    catRE = re.compile(r'<([LT]) (\S+)')
+    def _parseCategories(self, sentStrs):
+        """
+        Parse the categories of every node in the file as one batch,
+        so each distinct supertag is only parsed once. Returns a dict
+        mapping category strings to Categories.
+        """
+        catStrs = []
+        for sentStr in sentStrs:
+            for nodeType, cat in self.catRE.findall(sentStr):
+                if nodeType == 'L':
+                    cat = stripLeafCat(cat)[0]
+                catStrs.append(cat)
+        cats, index = ccg.category.from_strings(catStrs, self.lexicon)
+        return dict((catStr, cats[i]) for catStr, i in zip(catStrs, index))
+
+    def _addSentence(self, idLine, sentStr, categories=None):
         try:
             globalID = idLine.split(' ')[0].split('=')[1]
         except:
@@ -42,7 +62,8 @@ class CCGFile(File, CCGNode):
             print >> sys.stderr, idLine
             raise
         sentence = CCGSentence(globalID=globalID, string=sentStr,
-                               localID=self.length())
+                               localID=self.length(), categories=categories,
+                               lexicon=self.lexicon, arena=self.arena)
         self.attachChild(sentence)
         
     pargSentsRE = re.compile(r'<s id="[^"]+\.\d+"> \d+\n(?:(\d.+?)\n)?<\\s>', re.DOTALL)
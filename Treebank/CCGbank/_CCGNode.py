@@ -66,7 +66,7 @@ class CCGNode(Node):
         #    newLabel = ccg.category.from_string('NP/N')
         c0 = self.child(0)
         if c0.isLeaf():
-            newLabel._var_table[0] = self.label._var_table[0]
+            newLabel.share_globals(0, self.label)
             self.label = newLabel
             c0.changeLabel(newLabel)
             return None
@@ -84,7 +84,7 @@ class CCGNode(Node):
                             newLabel.deconstruct()]
                     nLabel = ccg.scat.add_args(ccg.scat.SuperCat('N'), args)
                     self.child(0).changeLabel(nLabel)
-                    newLabel._var_table[0] = self.label._var_table[0]
+                    newLabel.share_globals(0, self.label)
                     self.label = newLabel
                     return None
         if self.length() == 2:
@@ -95,7 +95,7 @@ class CCGNode(Node):
                 c0.changeLabel(production.left)
             if c1 and not production.right.exact_eq(c1.label):
                 c1.changeLabel(production.right)
-        newLabel._var_table[0] = self.label._var_table[0]
+        newLabel.share_globals(0, self.label)
         self.label = newLabel 
             
     def sibling(self):
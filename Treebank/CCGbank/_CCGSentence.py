@@ -8,8 +8,21 @@ import ccg.scat
 
 class CCGSentence(Sentence, CCGNode):
     def __init__(self, **kwargs):
+        """
+        If arena is set, the sentence's SuperCats keep their variables
+        in a ccg.scat.VariableArena, self.arena, while the sentence is
+        parsed and while unify_vars runs.
+        """
+        lexicon = kwargs.pop('lexicon', None)
+        if kwargs.pop('arena', False):
+            self.arena = ccg.scat.VariableArena()
+        else:
+            self.arena = None
         if 'string' in kwargs:
-            node = self._parseString(kwargs.pop('string'))
+            with ccg.scat.using_arena(self.arena):
+                node = self._parseString(kwargs.pop('string'),
+                                         kwargs.pop('categories', None),
+                                         lexicon)
         elif 'node' in kwargs:
             node = kwargs.pop('node')
         globalID = kwargs.pop('globalID')
@@ -103,6 +116,9 @@ class CCGSentence(Sentence, CCGNode):
         "it expects that to happen", "it" and "that" must not be
         coindexed.
         """
+        if self.arena is not ccg.scat.active_arena():
+            with ccg.scat.using_arena(self.arena):
+                return self.unify_vars()
         def unifyBranch(node):
             """
             Start at bottom left corner of the tree. Walk
@@ -147,7 +163,7 @@ class CCGSentence(Sentence, CCGNode):
                 continue
             if not conjNode.child(1).label.conj:
                 continue
-            varSet = set(v.get_ref() for v in conjNode.label.get_vars())
+            varSet = conjNode.label.get_vars()
             nodesBelowConj = set(conjNode.depthList())
             nodesBelowConj.add(conjNode)
             nodesToCheck = nodeSet - nodesBelowConj
@@ -158,8 +174,8 @@ class CCGSentence(Sentence, CCGNode):
                 if node.isLeaf() or node.isRoot():
                     continue
                 scat = node.label
-                for var, varSet in scat._var_table.items():
-                    varSet = set(v.get_ref() for v in varSet)
+                for var in scat._var_table.keys():
+                    varSet = scat.var_globals(var)
                     if not varSet.intersection(conjVars):
                         continue
                     words = set(v.word for v in varSet if v.word)
@@ -170,7 +186,7 @@ class CCGSentence(Sentence, CCGNode):
     # This returns 4 groups for compatibility with the
     # Root.parseString method
     bracketsRE = re.compile(r'(\()<([^>]+)>|()(\))')
-    def _parseString(self, text):
+    def _parseString(self, text, categories=None, lexicon=None):
         # The algorithm here is roughly, find and build the nodes,
         # and keep track of the parent. Then, later, connect the nodes together
         # into a tree
@@ -193,10 +209,11 @@ class CCGSentence(Sentence, CCGNode):
                     print text
                     raise
                 if nodeData.startswith('L'):
-                    newNode = self._makeLeaf(nodeData, nWords)
+                    newNode = self._makeLeaf(nodeData, nWords, categories,
+                                             lexicon)
                     nWords += 1
                 else:
-                    newNode = self._makeNode(nodeData)
+                    newNode = self._makeNode(nodeData, categories, lexicon)
                 if openBrackets:
                     parentStart = openBrackets[-1][1]
                     parentage[newNode] = parentStart
@@ -207,28 +224,26 @@ class CCGSentence(Sentence, CCGNode):
         self._connectNodes(nodes, parentage)
         return top
 
-    def _makeNode(self, nodeData):
+    def _makeNode(self, nodeData, categories=None, lexicon=None):
         try:
             T, cat, headIdx, nChildren = nodeData.split()
         except:
             print >> sys.stderr, nodeData
             raise
-        return CCGNode(label=ccg.scat.SuperCat(cat), headIdx=int(headIdx))
+        if categories:
+            cat = categories.get(cat, cat)
+        return CCGNode(label=ccg.scat.SuperCat(cat, lexicon=lexicon),
+                       headIdx=int(headIdx))
 
-    def _makeLeaf(self, nodeData, wordID):
+    def _makeLeaf(self, nodeData, wordID, categories=None, lexicon=None):
         L, cat, ccgPos, ptbPos, text, annotCat = nodeData.split()
-        if cat.endswith('/'):
-            cat = cat[1:-2]
-        if '@' in cat:
-            cat, srl_annot_str = cat.split('@')
-        else:
-            srl_annot_str = ''
+        cat, srl_annot_str = stripLeafCat(cat)
         # Check whether the @ is on the annotCat instead
         if not srl_annot_str and '@' in annotCat:
             annotCat, srl_annot_str = annotCat.split('@')
-        if cat.endswith('/'):
-            cat = cat[1:-2]
-        cat = ccg.scat.SuperCat(cat)
+        if categories:
+            cat = categories.get(cat, cat)
+        cat = ccg.scat.SuperCat(cat, lexicon=lexicon)
         for srl_triple in srl_annot_str.split('_'):
             if not srl_triple:
                 continue
@@ -238,3 +253,19 @@ class CCGSentence(Sentence, CCGNode):
                        parg=cat, wordID=wordID)
         parent.attachChild(leaf)
         return parent
+
+
+def stripLeafCat(cat):
+    """
+    Split a leaf's category field into the category string and
+    its SRL annotation string
+    """
+    if cat.endswith('/'):
+        cat = cat[1:-2]
+    if '@' in cat:
+        cat, srl_annot_str = cat.split('@')
+    else:
+        srl_annot_str = ''
+    if cat.endswith('/'):
+        cat = cat[1:-2]
+    return cat, srl_annot_str
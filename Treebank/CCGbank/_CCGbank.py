@@ -1,22 +1,47 @@
 import sys
 import re
 import os.path
+import multiprocessing
 
 import ccg.lexicon
+import ccg.tagdict
 from ._Corpus import Corpus
 from ._CCGNode import CCGNode
 from ._CCGFile import CCGFile
+from ._CCGSentence import stripLeafCat
+
+tokenRE = re.compile(r'<L (\S+) \S+ (\S+) (\S+) \S+>')
+
+def countTokens(path):
+    """
+    Count the supertags of a file's tokens without parsing it
+    """
+    frequencies = ccg.lexicon.Frequencies()
+    # Clean the text up as CCGFile does
+    text = CCGFile.mmRE.sub('', open(path).read())
+    for cat, pos, form in tokenRE.findall(text):
+        frequencies.add(form, pos, stripLeafCat(cat)[0])
+    return frequencies
 
 
 
 class CCGbank(Corpus, CCGNode):
     fileClass = CCGFile
-    def __init__(self, path=None, **kwargs):
+    def __init__(self, path=None, lexicon=None, arena=False, **kwargs):
+        """
+        If a ccg.lexicon.Lexicon is given, categories are read with it;
+        otherwise the corpus's markedup file is loaded as the global
+        lexicon. If arena is set, each sentence keeps its variables in
+        a ccg.scat.VariableArena.
+        """
         self._children = []
         self.path = path
+        self.lexicon = lexicon
+        self.arena = arena
         for fileLoc in self._getFileList(self.path):
             self.attachChild(fileLoc)
-        ccg.lexicon.load(os.path.join(path, 'markedup'))
+        if lexicon is None:
+            ccg.lexicon.load(os.path.join(path, 'markedup'))
 
     def child(self, index):
         """
@@ -24,7 +49,8 @@ class CCGbank(Corpus, CCGNode):
         """
         path = self._children[index]
         print >> sys.stderr, path
-        return self.fileClass(path=path)
+        return self.fileClass(path=path, lexicon=self.lexicon,
+                              arena=self.arena)
 
     def sentence(self, key):
         fileName, sentID = key.split('.')
@@ -40,12 +66,43 @@ class CCGbank(Corpus, CCGNode):
         """
         Generate tokens without parsing the files properly
         """
-        tokenRE = re.compile(r'<L (\S+) \S+ (\S+) (\S+) \S+>')
         for path in self._children:
             string = open(path).read()
             for cat, pos, form in tokenRE.findall(string):
                 yield form, pos, cat
 
+    def frequencies(self, processes=None):
+        """
+        Count supertags overall, by word and by POS tag, in a single
+        pass over the files. The files are counted in a pool of worker
+        processes, one per CPU by default, and the counts are merged.
+        Returns a ccg.lexicon.Frequencies, which can be saved next to
+        the markedup file with ccg.lexicon.write_frequencies.
+        """
+        frequencies = ccg.lexicon.Frequencies()
+        if processes == 1:
+            for path in self._children:
+                frequencies.update(countTokens(path))
+            return frequencies
+        pool = multiprocessing.Pool(processes)
+        try:
+            for counts in pool.imap_unordered(countTokens, self._children,
+                                              chunksize=16):
+                frequencies.update(counts)
+        finally:
+            pool.close()
+            pool.join()
+        return frequencies
+
+    def tagDict(self, processes=None, minWordCount=1):
+        """
+        Build a ccg.tagdict.TagDict from the corpus's supertag
+        frequencies, counted in parallel as in frequencies()
+        """
+        return ccg.tagdict.TagDict(self.frequencies(processes),
+                                   lexicon=self.lexicon,
+                                   min_word_count=minWordCount)
+
     def section(self, sec):
         for i, fileLoc in enumerate(self._children):
             path, fileName = os.path.split(fileLoc)
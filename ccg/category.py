@@ -1,5 +1,8 @@
 import re
-from collections import defaultdict
+import threading
+from array import array
+from collections import defaultdict, Mapping
+from itertools import izip
 
 import ccg.lexicon
 
@@ -11,67 +14,226 @@ _PRED_RE = re.compile(r'\(*S\[(b|dcl|ng|pss|pt|to)\]')
 _PUNCT = set([',', ':', ';', '.', "LQU", "RQU", "--", 'RRB', 'LRB'])
 
 
+class _lazy(object):
+    """
+    A derived Category attribute, computed on first access. The value
+    is kept in a slot named after the attribute with a leading
+    underscore, which is filled in once Category is defined.
+    """
+    def __init__(self, compute):
+        self.compute = compute
+        self.name = compute.__name__
+        self.__doc__ = compute.__doc__
+        self.slot = None
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        try:
+            return self.slot.__get__(obj, cls)
+        except AttributeError:
+            value = self.compute(obj)
+            self.slot.__set__(obj, value)
+            return value
+
+
 class Category(object):
+    __slots__ = ('result', 'argument', 'slash', 'is_complex', '_atom', 'hat',
+                 'conj', 'var', 'var2', 'asterisk', 'feat_var', 'feature',
+                 'arg_idx', '_var_given', '_lexicon',
+                 # Slots for the lazy attributes
+                 '_cat', '_string', '_annotated', '_next_var', '_hatless',
+                 '_str_as_piece', '_inner_result', '_is_predicate',
+                 '_is_adjunct', '_has_adjunct', '_is_aux', '_is_true_aux',
+                 '_is_punct', '_is_type_raise', '_forward', '_backward',
+                 '_exact_key', '_skeleton', '_shape', '_holes', '_id', '_cats',
+                 '_cats_by_var', '_active_features')
+
     def __init__(self, result, slash='', argument=None, **kwargs):
         import ccg.scat
         if isinstance(result, ccg.scat.SuperCat):
             result = result.category
         if isinstance(argument, ccg.scat.SuperCat):
             argument = argument.category
-        self.slash = slash
-        self.argument = argument
-        self.is_complex = bool(self.slash)
-        if self.is_complex:
-            self.result = result
+        # __setattr__ is there to stop attributes being changed, so
+        # set them with object's
+        set_attr = object.__setattr__
+        set_attr(self, 'slash', slash)
+        set_attr(self, 'argument', argument)
+        is_complex = bool(slash)
+        set_attr(self, 'is_complex', is_complex)
+        if is_complex:
+            set_attr(self, 'result', result)
         else:
-            self.result = self
-            self._cat = result if isinstance(result, str) else result.cat
-        self.kwargs = kwargs
-        self.hat = kwargs.get('hat')
-        self.conj = kwargs.get('conj', False)
-        self.var = kwargs.get('var', 0)
-        self.var2 = kwargs.get('var2', -1)
-        self.asterisk = kwargs.get('asterisk', False)
-        self.feat_var = kwargs.get('feat_var')
-        self.feature = kwargs.get('feature', '')
-        self.arg_idx = kwargs.get('arg_idx')
+            set_attr(self, 'result', self)
+            set_attr(self, '_atom',
+                     result if isinstance(result, str) else result.cat)
+        set_attr(self, 'hat', kwargs.get('hat'))
+        set_attr(self, 'conj', kwargs.get('conj', False))
+        set_attr(self, 'var', kwargs.get('var', 0))
+        set_attr(self, '_var_given', 'var' in kwargs)
+        set_attr(self, 'var2', kwargs.get('var2', -1))
+        set_attr(self, 'asterisk', kwargs.get('asterisk', False))
+        set_attr(self, 'feat_var', kwargs.get('feat_var'))
+        set_attr(self, 'feature', kwargs.get('feature', ''))
+        set_attr(self, 'arg_idx', kwargs.get('arg_idx'))
+        # The lexicon the category was parsed with, which its strings
+        # are parsed with again, or None for the global CATS. Complex
+        # categories built from pieces take their result's.
+        set_attr(self, '_lexicon', result._lexicon if is_complex else None)
 
+    @property
+    def kwargs(self):
+        """
+        The keyword arguments that would rebuild this category. Built
+        from the attributes on each access, rather than stored.
+        """
+        kwargs = {}
+        if self._var_given:
+            kwargs['var'] = self.var
+        if self.hat is not None:
+            kwargs['hat'] = self.hat
+        if self.conj:
+            kwargs['conj'] = self.conj
+        if self.var2 != -1:
+            kwargs['var2'] = self.var2
+        if self.asterisk:
+            kwargs['asterisk'] = self.asterisk
+        if self.feat_var is not None:
+            kwargs['feat_var'] = self.feat_var
+        if self.feature:
+            kwargs['feature'] = self.feature
+        if self.arg_idx is not None:
+            kwargs['arg_idx'] = self.arg_idx
+        return kwargs
+
+    def __reduce__(self):
+        # Keep the rendered strings, so they need not be recomputed
+        rendered = (self.cat, self.string, self.annotated)
         if self.is_complex:
-            str_get = self._complex_strings
-            cat_get = self._complex_cats
+            return _rebuild, (self.result, self.slash, self.argument,
+                              self.kwargs, rendered)
         else:
-            str_get = self._atomic_strings
-            cat_get = self._atomic_cats
-        self.cats, self.cats_by_var, self.active_features = cat_get()
-        self.next_var = max(self.cats_by_var) + 1
-        self.cat, self.string, self.annotated = str_get()
+            return _rebuild, (self._atom, '', None, self.kwargs, rendered)
+
+    # Derived attributes are computed on first access. Categories are
+    # immutable, so the value is then kept for good.
+    @_lazy
+    def cat(self):
+        return self._render()[0]
+
+    @_lazy
+    def string(self):
+        return self._render()[1]
+
+    @_lazy
+    def annotated(self):
+        return self._render()[2]
+
+    @_lazy
+    def next_var(self):
+        return max(self.cats_by_var) + 1
+
+    @_lazy
+    def hatless(self):
         if not '^' in self.string:
-            self.hatless = self.string
+            return self.string
+        else:
+            return None
+
+    @_lazy
+    def str_as_piece(self):
+        if self.is_complex and not self.hat:
+            return '(%s)' % self
         else:
-            self.hatless = None
+            return self.string
 
-        # Higher-order attributes. Could be properties, but I'm assuming
-        # categories are immutable, and this should be more efficient
-        self.str_as_piece = '(%s)' % self if (self.is_complex and not
-                                              self.hat) else self.string
+    @_lazy
+    def inner_result(self):
         # Result leaf is at (0, 0, ...) with the longest path
-        self.inner_result = max((p, c) for p, c in self.cats.items()
-                                if not any(p))[1]
-        self.is_predicate = bool(_PRED_RE.match(self.string))
-        self.is_adjunct = (self.result.exact_eq(self.argument) 
-                           and self.result.var == self.argument.var
-                           and all(c for (p, c) in self.result.cats.items()
-                                   if self.argument.cats[p].var == c.var))
-        self.has_adjunct = any(r[0].is_adjunct for r in self.deconstruct())
-        self.is_aux = bool(_AUX_RE.match(self.string))
-        self.is_true_aux = self.is_aux and self.inner_result.feature in _FEATS
-        self.is_punct = (not self.is_complex and self.string in _PUNCT)
-        self.is_type_raise = (self.is_complex
-                              and self.argument.is_complex
-                              and self.slash != self.argument.slash
-                              and self.result.exact_eq(self.argument.result))
-        self.forward = bool(self.is_complex and self.slash == '/')
-        self.backward = bool(self.is_complex and self.slash == '\\')
+        return max((p, c) for p, c in self.cats.items() if not any(p))[1]
+
+    @_lazy
+    def is_predicate(self):
+        return bool(_PRED_RE.match(self.string))
+
+    @_lazy
+    def is_adjunct(self):
+        return (self.result.exact_eq(self.argument) 
+                and self.result.var == self.argument.var
+                and all(c for (p, c) in self.result.cats.items()
+                        if self.argument.cats[p].var == c.var))
+
+    @_lazy
+    def has_adjunct(self):
+        return any(r[0].is_adjunct for r in self.deconstruct())
+
+    @_lazy
+    def is_aux(self):
+        return bool(_AUX_RE.match(self.string))
+
+    @_lazy
+    def is_true_aux(self):
+        return self.is_aux and self.inner_result.feature in _FEATS
+
+    @_lazy
+    def is_punct(self):
+        return not self.is_complex and self.string in _PUNCT
+
+    @_lazy
+    def is_type_raise(self):
+        return (self.is_complex
+                and self.argument.is_complex
+                and self.slash != self.argument.slash
+                and self.result.exact_eq(self.argument.result))
+
+    @_lazy
+    def forward(self):
+        return bool(self.is_complex and self.slash == '/')
+
+    @_lazy
+    def backward(self):
+        return bool(self.is_complex and self.slash == '\\')
+
+    @_lazy
+    def skeleton(self):
+        """
+        The category with features, hats, variables and conj removed,
+        as an interned string
+        """
+        if not self.is_complex:
+            return intern(self._atom)
+        pieces = []
+        for piece in (self.result, self.argument):
+            if piece.is_complex:
+                pieces.append('(%s)' % piece.skeleton)
+            else:
+                pieces.append(piece.skeleton)
+        return intern(pieces[0] + self.slash + pieces[1])
+
+    @_lazy
+    def shape(self):
+        """
+        The skeleton without the slashes below the top one, as an
+        interned string: __eq__ compares the top slash, the tree and the
+        atoms, but not the inner slashes
+        """
+        if not self.is_complex:
+            return self.skeleton
+        return intern(_shape_piece(self.result) + self.slash +
+                      _shape_piece(self.argument))
+
+    @_lazy
+    def holes(self):
+        """
+        The (feature, hat) pairs left out of the shape that __eq__
+        compares: the category's own, then each atom's in left-to-right
+        order.
+        """
+        own = (self.feature, self.hat)
+        if not self.is_complex:
+            return (own, own)
+        return (own,) + self.result.holes[1:] + self.argument.holes[1:]
 
     def __eq__(self, other):
         """
@@ -82,32 +244,19 @@ class Category(object):
         if self is other:
             return True
         if isinstance(other, str):
-            other = from_string(other)
-        if self.is_complex != other.is_complex:
+            other = _eq_operand(other, self._lexicon)
+        elif not isinstance(other, Category):
+            # SuperCats compare by their category
+            other = getattr(other, 'category', None)
+            if other is None:
+                return False
+        if self.shape is not other.shape:
             return False
         # Fail on feature or hat if it's there and doesnt match
-        if self.feature and other.feature and self.feature != other.feature:
-            return False
-        if self.hat and other.hat and self.hat != other.hat:
-            return False
-        if self.slash != other.slash:
-            return False
-        s_cats = self.cats
-        o_cats = other.cats
-        if len(s_cats.keys()) != len(o_cats.keys()):
-            return False
-        for path, s_cat in s_cats.items():
-            if path not in o_cats:
-                return False
-            if s_cat.is_complex:
-                continue
-            o_cat = o_cats[path]
-            if s_cat.cat != o_cat.cat:
-                return False
-            if (s_cat.feature and o_cat.feature 
-                and s_cat.feature != o_cat.feature):
+        for (s_feat, s_hat), (o_feat, o_hat) in zip(self.holes, other.holes):
+            if s_feat and o_feat and s_feat != o_feat:
                 return False
-            if s_cat.hat and o_cat.hat and s_cat.hat != o_cat.hat:
+            if s_hat and o_hat and s_hat != o_hat:
                 return False
         return True 
 
@@ -124,42 +273,49 @@ class Category(object):
         return self.string
 
     def __hash__(self):
-        return hash(str(self))
+        """
+        Hash the shape, the part of the category that __eq__ compares
+        exactly: features and hats match when either side lacks them,
+        so S and S[dcl] are equal and must hash alike. Feature variants
+        such as S[dcl]\NP and S[b]\NP hash alike but stay apart as
+        keys, as they are not equal.
+        """
+        return hash(self.shape)
 
     def __repr__(self):
         return str(self)
 
     def __setattr__(self, attr, value):
         """
-        Make Categories immutable by ensuring values
-        that have been set can never be over-written
+        Make Categories immutable. Attributes are only set
+        during __init__, or when a lazy attribute is computed.
         """
-        if attr in self.__dict__:
-            raise AttributeError(attr)
-        else:
-            self.__dict__[attr] = value
+        raise AttributeError(attr)
+
+    @_lazy
+    def id(self):
+        """
+        Dense integer ID of the category in ccg.category.CATEGORIES
+        """
+        return CATEGORIES.id_of(self)
 
     non_s_feat_re = re.compile(r'(?<!S)\[\w+]+')
+    @_lazy
+    def exact_key(self):
+        """
+        Key for exact_eq: the conj flag and the string with the
+        features on non-S nodes removed. Two categories are exactly
+        equal iff their keys are equal.
+        """
+        return self.conj, intern(self.non_s_feat_re.sub('', self.string))
+
     def exact_eq(self, other):
         if self is other:
             return True
         elif other is None:
             return False
-        if self.conj != other.conj:
-            return False
-        else:
-            # Succeed if features are different on non-S nodes
-            self_str = self.non_s_feat_re.sub('', self.string)
-            other_str  =self.non_s_feat_re.sub('', other.string)
-            return self_str == other_str
-        #elif isinstance(other, str):
-        #    return self.string == other
-        #elif isinstance(other, Category):
-        #    return self.string == other.string
-        #elif isinstance(other, ccg.scat.SuperCat):
-        #    return self.string == other.string
-        #else:
-        #    return False
+        # Succeed if features are different on non-S nodes
+        return self.exact_key == other.exact_key
 
     def deconstruct(self):
         """
@@ -224,10 +380,24 @@ class Category(object):
     # goldDependencies, fullPrint
 
 
+    def _render(self):
+        """
+        Compute the cat, string and annotated attributes together
+        """
+        if self.is_complex:
+            rendered = self._complex_strings()
+        else:
+            rendered = self._atomic_strings()
+        set_attr = object.__setattr__
+        set_attr(self, '_cat', rendered[0])
+        set_attr(self, '_string', rendered[1])
+        set_attr(self, '_annotated', rendered[2])
+        return rendered
+
     def _atomic_strings(self):
         hat_str = '^%s' % self.hat.str_as_piece if self.hat else ''
         feat_str = self.feature
-        pieces = [self._cat, feat_str, hat_str]
+        pieces = [self._atom, feat_str, hat_str]
 
         feat_annot = self.feat_var if self.feat_var else self.feature
         hat_annot = '^%s' % self.hat.annotated if self.hat else ''
@@ -235,7 +405,7 @@ class Category(object):
         var2 = ',%s' % VARS[self.var2] if self.var2 >= 0 else ''
         arg_idx = '<%s>' % self.arg_idx if self.arg_idx else ''
         var_str = '{%s%s%s}%s' % (VARS[self.var], var2, asterisk, arg_idx)
-        annot_pieces = [self._cat, feat_annot, hat_annot, var_str]
+        annot_pieces = [self._atom, feat_annot, hat_annot, var_str]
 
         if self.conj:
             pieces.append('[conj]')
@@ -243,7 +413,7 @@ class Category(object):
             annotated = '(%s\%s){%s}' % (annot_cat, annot_cat, VARS[self.var])
         else:
             annotated = ''.join(annot_pieces)
-        return self._cat, ''.join(pieces), annotated
+        return self._atom, ''.join(pieces), annotated
 
     def _complex_strings(self):
         res_str = self.result.str_as_piece
@@ -264,7 +434,7 @@ class Category(object):
         # All this effort to get the correct annotation for conj
         # categories, when it (probably?) doesn't matter...
         if self.conj:
-            non_conj = from_string(cat)
+            non_conj = from_string(cat, lexicon=self._lexicon)
             var_map = dict((v, v+1) for v in non_conj.cats_by_var)
 
             result = ccg.rules.remap_vars(non_conj, var_map)
@@ -279,142 +449,636 @@ class Category(object):
         return cat, string, annot_cat
 
  
-    def _atomic_cats(self):
-        cats = {(): self}
-        cats_by_var = {self.var: [self]}
-        if self.var2 >= 0:
-            cats_by_var[self.var2] = [self]
-        active_features = {(): self} if self.feature else {}
-        return cats, cats_by_var, active_features
-
-    def _complex_cats(self):
-        # Get list of all cats in tree and their position
-        cats = {tuple(): self}
-        active_features = {}
-        cats_by_var = defaultdict(list)
-        cats_by_var[self.var].append(self)
-        if self.var2 >= 0 and self.var2 != self.var:
-            cats_by_var[self.var2].append(self)
-        for piece, path_prefix in ((self.result, 0), (self.argument, 1)):
-            for path, cat in piece.cats.items():
-                cats[(path_prefix,) + path] = cat
-            for var, cat_list in piece.cats_by_var.items():
-                cats_by_var[var].extend(cat_list)
-            for path, cat in piece.active_features.items():
-                active_features[(path_prefix,) + path] = cat
-        return cats, cats_by_var, active_features
-
-
-var_re = re.compile(r'\{(\w)(?:,(\w))?(\*)?\}$')
-def from_string(cat_str, **kwargs):
-    global VARS
-    assert cat_str
-    assert cat_str.count('(') == cat_str.count(')')
+    @_lazy
+    def cats(self):
+        """
+        Every sub-category, keyed by its path from the root
+        """
+        return _PathView(self)
+
+    @_lazy
+    def active_features(self):
+        """
+        The sub-categories that have a feature, keyed by path
+        """
+        return _PathView(self, featured=True)
+
+    @_lazy
+    def cats_by_var(self):
+        """
+        The sub-categories with each variable, in left-to-right order
+        """
+        if self.is_complex:
+            cats_by_var = defaultdict(list)
+        else:
+            cats_by_var = {}
+        for path, cat in self.cats.iteritems():
+            cats_by_var.setdefault(cat.var, []).append(cat)
+            if cat.var2 >= 0 and cat.var2 != cat.var:
+                cats_by_var.setdefault(cat.var2, []).append(cat)
+        return cats_by_var
+
+
+def _shape_piece(category):
+    if not category.is_complex:
+        return category.skeleton
+    return '(%s|%s)' % (_shape_piece(category.result),
+                        _shape_piece(category.argument))
+
+
+# Paths are shared between all the categories that have them
+_PATHS = {}
+
+
+def _child_path(path, step):
+    key = (path, step)
+    child_path = _PATHS.get(key)
+    if child_path is None:
+        child_path = _PATHS.setdefault(key, path + (step,))
+    return child_path
+
+
+class _PathView(Mapping):
+    """
+    A read-only mapping from paths to the sub-categories of a category.
+    A path is a tuple of 0s and 1s, for result and argument, and the
+    root is at (). Lookups walk the tree, so a category shares its
+    children's structure instead of copying their paths; the paths are
+    only listed if the view is iterated. Iteration is in pre-order,
+    root first.
+    """
+    def __init__(self, category, featured=False):
+        self._category = category
+        self._featured = featured
+        # (paths, cats), set in one step as categories are shared
+        # between threads
+        self._items = None
+
+    def __getitem__(self, path):
+        cat = self._category
+        try:
+            for step in path:
+                if not cat.is_complex:
+                    raise KeyError(path)
+                elif step == 0:
+                    cat = cat.result
+                elif step == 1:
+                    cat = cat.argument
+                else:
+                    raise KeyError(path)
+        except TypeError:
+            raise KeyError(path)
+        if self._featured and not cat.feature:
+            raise KeyError(path)
+        return cat
+
+    def _list(self):
+        items = self._items
+        if items is not None:
+            return items
+        paths = []
+        cats = []
+        stack = [((), self._category)]
+        while stack:
+            path, cat = stack.pop()
+            if cat.feature or not self._featured:
+                paths.append(path)
+                cats.append(cat)
+            if cat.is_complex:
+                stack.append((_child_path(path, 1), cat.argument))
+                stack.append((_child_path(path, 0), cat.result))
+        items = self._items = (tuple(paths), tuple(cats))
+        return items
+
+    def __len__(self):
+        return len(self._list()[0])
+
+    def __iter__(self):
+        return iter(self._list()[0])
+
+    def __contains__(self, path):
+        try:
+            self[path]
+        except KeyError:
+            return False
+        return True
+
+    def iteritems(self):
+        paths, cats = self._list()
+        return izip(paths, cats)
+
+    def itervalues(self):
+        return iter(self._list()[1])
+
+    def items(self):
+        return list(self.iteritems())
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+
+for _attr in vars(Category).values():
+    if isinstance(_attr, _lazy):
+        _attr.slot = getattr(Category, '_' + _attr.name)
+
+
+def _rebuild(result, slash, argument, kwargs, rendered=None):
+    category = Category(result, slash, argument, **kwargs)
+    if rendered is not None:
+        set_attr = object.__setattr__
+        set_attr(category, '_cat', rendered[0])
+        set_attr(category, '_string', rendered[1])
+        set_attr(category, '_annotated', rendered[2])
+    return category
+
+
+# Strings that categories have been compared against, such as the
+# constants in ccg.rules, so that each is only compiled once
+_EQ_OPERANDS = {}
+_MAX_EQ_OPERANDS = 10000
+
+
+def _eq_operand(cat_str, lexicon=None):
+    if lexicon is not None and lexicon is not ccg.lexicon.CATS:
+        # Kept by the lexicon's own intern table. Pass a kwarg, so the
+        # string is not looked up or guessed, which would count a miss.
+        return from_string(cat_str, lexicon=lexicon, top=False)
+    category = _EQ_OPERANDS.get(cat_str)
+    if category is None:
+        if len(_EQ_OPERANDS) >= _MAX_EQ_OPERANDS:
+            _EQ_OPERANDS.clear()
+        category = from_string(cat_str)
+        _EQ_OPERANDS[cat_str] = category
+    return category
+
+
+class InternTable(object):
+    """
+    Shares one immutable Category between every from_string call that
+    asks for the same category. Entries are keyed on the canonical
+    annotated form of the category, and lookups on the string and
+    kwargs they were requested with. If max_size is set, the table is
+    kept in two segments of half that many lookups each: when the
+    newer segment fills, the older one is dropped and the newer one
+    takes its place, and entries found in the older segment are moved
+    back into the newer one, so the categories still in use survive.
+    """
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lookups = {}
+        self._forms = {}
+        self._old_lookups = {}
+        self._old_forms = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        forms = self._forms
+        return len(forms) + sum(1 for form in self._old_forms
+                                if form not in forms)
+
+    def get(self, key):
+        category = self._lookups.get(key)
+        if category is None:
+            category = self._old_lookups.get(key)
+            if category is None:
+                self.misses += 1
+                return None
+            with self._lock:
+                self._store(key, category, canonical_form(category))
+        self.hits += 1
+        return category
+
+    def add(self, key, category):
+        """
+        Store the category under the lookup key, and return the shared
+        instance for its canonical form
+        """
+        form = canonical_form(category)
+        with self._lock:
+            shared = self._forms.get(form)
+            if shared is None:
+                shared = self._old_forms.get(form, category)
+            self._store(key, shared, form)
+        return shared
+
+    def _store(self, key, category, form):
+        # Called with the lock held
+        if (self.max_size is not None
+            and len(self._lookups) >= max(1, self.max_size // 2)):
+            self._old_lookups = self._lookups
+            self._old_forms = self._forms
+            self._lookups = {}
+            self._forms = {}
+        self._lookups[key] = category
+        self._forms[form] = category
+
+    def clear(self):
+        with self._lock:
+            self._lookups.clear()
+            self._forms.clear()
+            self._old_lookups.clear()
+            self._old_forms.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+INTERNED = InternTable()
+
+
+def canonical_form(category):
+    """
+    A hashable key identifying the category exactly, i.e. including
+    its variables, features and hat
+    """
+    return (category.annotated, category.string, category.var,
+            category.var2, bool(category.asterisk), category.arg_idx,
+            category._var_given)
+
+
+class CategoryTable(object):
+    """
+    Assigns each distinct Category a dense integer ID, in the order
+    the categories are first seen. Categories are distinct if their
+    canonical forms differ. Tables pickle, and a table built in
+    another process can be merged in, which maps its IDs onto this
+    table's.
+    """
+    def __init__(self, categories=()):
+        self._ids = {}
+        self._categories = []
+        self._lock = threading.Lock()
+        for category in categories:
+            self.id_of(category)
+
+    def __len__(self):
+        return len(self._categories)
+
+    def __iter__(self):
+        return iter(self._categories)
+
+    def __contains__(self, category):
+        return canonical_form(category) in self._ids
+
+    def __getitem__(self, category_id):
+        return self._categories[category_id]
+
+    def id_of(self, category):
+        """
+        The ID of the category, assigning the next one if it is new
+        """
+        form = canonical_form(category)
+        category_id = self._ids.get(form)
+        if category_id is None:
+            with self._lock:
+                category_id = self._ids.get(form)
+                if category_id is None:
+                    category_id = len(self._categories)
+                    self._categories.append(category)
+                    self._ids[form] = category_id
+        return category_id
+
+    def rebind(self, category):
+        """
+        Store the category under its ID in place of an earlier category
+        with the same canonical form, e.g. when the lexicon is loaded
+        again, and return the ID
+        """
+        form = canonical_form(category)
+        with self._lock:
+            category_id = self._ids.get(form)
+            if category_id is None:
+                category_id = len(self._categories)
+                self._categories.append(category)
+                self._ids[form] = category_id
+            else:
+                self._categories[category_id] = category
+        return category_id
+
+    def get_id(self, category, default=None):
+        """
+        The ID of the category, or default if it has none
+        """
+        return self._ids.get(canonical_form(category), default)
+
+    def merge(self, other):
+        """
+        Add the categories of another table, and return an array
+        mapping its IDs to the IDs in this table
+        """
+        return array('i', [self.id_of(category) for category in other])
+
+    def __getstate__(self):
+        # A tuple, as pickle skips __setstate__ for an empty state
+        return (self._categories,)
+
+    def __setstate__(self, state):
+        self.__init__(state[0])
+
+
+# The table the Category.id attribute refers to. ccg.lexicon.load
+# rebinds the loaded lexicon's categories.
+CATEGORIES = CategoryTable()
+
+
+def _lookup_key(cat_str, kwargs):
+    items = []
+    for key, value in sorted(kwargs.items()):
+        if isinstance(value, Category):
+            value = canonical_form(value)
+        items.append((key, value))
+    return cat_str, tuple(items)
+
+
+class CategorySyntaxError(ValueError):
+    def __init__(self, cat_str, position, problem):
+        msg = '%s at position %d of %s' % (problem, position, cat_str)
+        ValueError.__init__(self, msg)
+        self.cat_str = cat_str
+        self.position = position
+
+
+_TOKEN_RE = re.compile(r'([a-zA-Z,\.;:]+)|(\[[^\]]+\])|(\{[^}]*\})|<(\d+)>|'
+                       r'([()/\\^])')
+_VAR_RE = re.compile(r'\{(\w)(?:,(\w))?(\*)?\}$')
+# Token kinds. Brackets, slashes and hats are their own kind.
+_ATOM, _FEAT, _VAR, _IDX = 'atom', 'feat', 'var', 'idx'
+
+
+def _first_gap(cat_str):
+    position = 0
+    for token in _TOKEN_RE.finditer(cat_str):
+        if token.start() != position:
+            break
+        position = token.end()
+    return position
+
+
+class _Tokens(object):
+    """
+    A category string tokenized in a single left-to-right pass. Along
+    with the tokens, records for each token the index of the first slash
+    and hat at the same bracket depth, so that the parser never has to
+    rescan a piece of the string. The parser also keeps the lexicon
+    and intern table for the parse here.
+    """
+    lexicon = None
+    cats = {}
+    interned = None
+
+    def __init__(self, cat_str):
+        self.string = cat_str
+        kinds = []
+        values = []
+        starts = []
+        depths = []
+        match = {}
+        open_brackets = []
+        depth = 0
+        position = 0
+        for atom, feat, var, idx, op in _TOKEN_RE.findall(cat_str):
+            starts.append(position)
+            if op:
+                if op == '(':
+                    open_brackets.append(len(kinds))
+                    depths.append(depth)
+                    depth += 1
+                elif op == ')':
+                    if not open_brackets:
+                        raise CategorySyntaxError(cat_str, position,
+                                                  'Unmatched bracket')
+                    depth -= 1
+                    depths.append(depth)
+                    match[open_brackets.pop()] = len(kinds)
+                else:
+                    depths.append(depth)
+                kinds.append(op)
+                values.append(op)
+                position += 1
+                continue
+            depths.append(depth)
+            if atom:
+                kinds.append(_ATOM)
+                values.append(atom)
+                position += len(atom)
+            elif feat:
+                kinds.append(_FEAT)
+                values.append(feat)
+                position += len(feat)
+            elif var:
+                kinds.append(_VAR)
+                values.append(var)
+                position += len(var)
+            else:
+                kinds.append(_IDX)
+                values.append(idx)
+                position += len(idx) + 2
+        # Tokens never overlap, so they cover the string iff their
+        # lengths sum to its length
+        if position != len(cat_str):
+            raise CategorySyntaxError(cat_str, _first_gap(cat_str),
+                                      'Bad character')
+        if open_brackets:
+            raise CategorySyntaxError(cat_str, starts[open_brackets[-1]],
+                                      'Unmatched bracket')
+        starts.append(len(cat_str))
+        n = len(kinds)
+        top_slash = [n] * n
+        top_hat = [n] * n
+        first_hat = [n] * (n + 1)
+        next_slash = {}
+        next_hat = {}
+        for i in xrange(n - 1, -1, -1):
+            kind = kinds[i]
+            depth = depths[i]
+            if kind == ')':
+                next_slash.pop(depth + 1, None)
+                next_hat.pop(depth + 1, None)
+            elif kind == '/' or kind == '\\':
+                next_slash[depth] = i
+            elif kind == '^':
+                next_hat[depth] = i
+            top_slash[i] = next_slash.get(depth, n)
+            top_hat[i] = next_hat.get(depth, n)
+            first_hat[i] = i if kind == '^' else first_hat[i + 1]
+        self.kinds = kinds
+        self.values = values
+        self.starts = starts
+        self.depths = depths
+        self.match = match
+        self.top_slash = top_slash
+        self.top_hat = top_hat
+        self.first_hat = first_hat
+
+    def text(self, i, j):
+        return self.string[self.starts[i]:self.starts[j]]
+
+    def strip(self, i, j):
+        """
+        Remove one layer of brackets around tokens i to j
+        """
+        if i < j and self.kinds[i] == '(' and self.match[i] == j - 1:
+            return i + 1, j - 1
+        return i, j
+
+    def error(self, i, problem):
+        return CategorySyntaxError(self.string, self.starts[i], problem)
+
+
+def from_string(cat_str, lexicon=None, **kwargs):
+    """
+    Parse a category string. Strings and sub-strings are looked up in
+    the lexicon, and new categories are shared through its intern
+    table. If no lexicon is given, the global ccg.lexicon.CATS and
+    INTERNED are used. The lexicon guesses the annotation of bare
+    strings it does not have.
+    """
+    if not cat_str:
+        raise CategorySyntaxError(cat_str, 0, 'Empty category')
     cat_str = cat_str.replace('[nb]', '')
-    if not kwargs and cat_str in ccg.lexicon.CATS:
-        return ccg.lexicon.CATS[cat_str]
+    if lexicon is None:
+        cats = ccg.lexicon.CATS
+        interned = INTERNED
+    else:
+        cats = lexicon
+        interned = lexicon.interned
+    if not kwargs:
+        if cat_str in cats:
+            return cats[cat_str]
+        # Guess the annotation of bare categories the lexicon lacks
+        elif hasattr(cats, 'guess'):
+            cat_str = cats.guess(cat_str)
+    key = _lookup_key(cat_str, kwargs)
+    category = interned.get(key)
+    if category is None:
+        tokens = _Tokens(cat_str)
+        tokens.lexicon = lexicon
+        tokens.cats = cats
+        tokens.interned = interned
+        category = _parse(tokens, 0, len(tokens.kinds), kwargs)
+        category = interned.add(key, category)
+    return category
+
+
+def from_strings(cat_strs, lexicon=None):
+    """
+    Parse a batch of category strings, such as all the supertags in a
+    section. Each distinct string is parsed once, and sub-categories
+    are shared through the intern table. Returns the list of distinct
+    Categories and an array giving, for each input string, the index
+    of its Category in that list.
+    """
+    categories = []
+    index = array('i')
+    by_string = {}
+    by_category = {}
+    for cat_str in cat_strs:
+        position = by_string.get(cat_str)
+        if position is None:
+            category = from_string(cat_str, lexicon=lexicon)
+            position = by_category.get(id(category))
+            if position is None:
+                position = len(categories)
+                by_category[id(category)] = position
+                categories.append(category)
+            by_string[cat_str] = position
+        index.append(position)
+    return categories, index
+
+
+def _parse_piece(tokens, i, j, kwargs):
+    """
+    Get the category for tokens i to j, as from_string would for that
+    substring, without tokenizing it again
+    """
+    if i >= j:
+        raise tokens.error(i, 'Missing category')
+    cat_str = tokens.text(i, j)
+    if not kwargs and cat_str in tokens.cats:
+        return tokens.cats[cat_str]
+    key = _lookup_key(cat_str, kwargs)
+    category = tokens.interned.get(key)
+    if category is None:
+        category = tokens.interned.add(key, _parse(tokens, i, j, kwargs))
+    return category
+
+
+def _parse(tokens, i, j, kwargs):
+    kinds = tokens.kinds
+    values = tokens.values
     # Add a kwarg to stop subpieces being looked up in CATS
     kwargs['top'] = False
-    if cat_str.endswith('>'):
-        kwargs['arg_idx'] = cat_str[-2]
-        cat_str = cat_str[:-3]
-    
-    if cat_str.endswith('[conj]'):
+    if kinds[j - 1] == _IDX:
+        kwargs['arg_idx'] = values[j - 1]
+        j -= 1
+
+    if kinds[j - 1] == _FEAT and values[j - 1] == '[conj]':
         kwargs['conj'] = True
-        cat_str = cat_str[:-6]
-        if cat_str in ccg.lexicon.CATS:
-            annotated = ccg.lexicon.CATS[cat_str].annotated
-            return from_string(annotated, **kwargs)
+        j -= 1
+        if i >= j:
+            raise tokens.error(i, 'Missing category')
+        cat_str = tokens.text(i, j)
+        if cat_str in tokens.cats:
+            annotated = tokens.cats[cat_str].annotated
+            return from_string(annotated, lexicon=tokens.lexicon, **kwargs)
     elif 'conj' not in kwargs:
         kwargs['conj'] = False
 
     # Handle top-level hat
-    hat_idx = cat_str.find('^')
-    if hat_idx != -1 and cat_str.endswith('{_}'):
+    hat = tokens.first_hat[i]
+    if hat < j and values[j - 1] == '{_}' and \
+       tokens.depths[hat] == tokens.depths[i]:
         assert 'hat' not in kwargs
-        base_str = cat_str[:hat_idx]
-        if base_str.count('(') == base_str.count(')'):
-            kwargs['hat'] = from_string(cat_str[hat_idx + 1:])
-            return from_string(base_str, **kwargs)
-        
-    var_match = var_re.search(cat_str)
-    if var_match is not None:
-        var = var_match.group(1)
-        var2 = var_match.group(2)
-        kwargs['asterisk'] = var_match.group(3)
+        kwargs['hat'] = _parse_piece(tokens, hat + 1, j, {})
+        return _parse_piece(tokens, i, hat, kwargs)
+
+    if kinds[j - 1] == _VAR:
+        var_match = _VAR_RE.match(values[j - 1])
+        if var_match is None:
+            raise tokens.error(j - 1, 'Bad variable')
+        var, var2, asterisk = var_match.groups()
+        if var not in VARS or (var2 and var2 not in VARS):
+            raise tokens.error(j - 1, 'Bad variable')
+        kwargs['asterisk'] = asterisk
         kwargs['var'] = VARS.index(var)
         if var2:
             kwargs['var2'] = VARS.index(var2)
-        cat_str = _strip_brackets(cat_str[:var_match.start()])
-    
-    if '/' not in cat_str and '\\' not in cat_str:
-        category = _parse_atomic(cat_str, kwargs)
-    else:
-        category = _parse_complex(cat_str, kwargs)
+        i, j = tokens.strip(i, j - 1)
+        if i >= j:
+            raise tokens.error(i, 'Missing category')
 
-    #if not kwargs and '{' in cat_str:
-    #    print cat_str
-    #    lexicon.CATS[cat_str] = category
-    #    lexicon.CATS[category.string] = category
-    return category
-
-def _parse_atomic(cat_str, kwargs):
-    if '^' in cat_str:
-        cat_str, hat_str = cat_str.split('^', 1)
-        kwargs['hat'] = from_string(hat_str)
-    assert cat_str
-    match = _ATOMIC_RE.match(cat_str)
-    if match is None:
-        raise StandardError(cat_str)
-    atom, feature, conj = match.groups()
-    if feature:
+    slash = tokens.top_slash[i]
+    if slash < j:
+        result = _parse_piece(tokens, *tokens.strip(i, slash), kwargs={})
+        argument = _parse_piece(tokens, *tokens.strip(slash + 1, j), kwargs={})
+        return _make(tokens, result, values[slash], argument, **kwargs)
+    hat = tokens.top_hat[i]
+    if hat < j:
+        kwargs['hat'] = _parse_piece(tokens, *tokens.strip(hat + 1, j),
+                                     kwargs={})
+        return _parse_piece(tokens, *tokens.strip(i, hat), kwargs=kwargs)
+    if kinds[i] != _ATOM:
+        raise tokens.error(i, 'Expected atomic category')
+    if i + 1 < j and kinds[i + 1] == _FEAT:
+        feature = values[i + 1]
         if feature[1].isupper():
             kwargs['feat_var'] = feature
         else:
             kwargs['feature'] = feature
-    return Category(atom, **kwargs)
-
-
-def _parse_complex(cat_str, kwargs):
-    depth = 0
-    slashes = set(('/', '\\'))
-    hats = []
-    if not cat_str.count('(') == cat_str.count(')'):
-        raise StandardError(cat_str)
-    for i, c in enumerate(cat_str):
-        if c == '(':
-            depth += 1
-        elif c == ')':
-            depth -= 1
-        elif depth == 0:
-            if c in slashes:
-                hats = []
-                result = from_string(_strip_brackets(cat_str[:i]))
-                slash = cat_str[i]
-                argument = from_string(_strip_brackets(cat_str[i + 1:]))
-                return Category(result, slash, argument, **kwargs)
-            elif c == '^':
-                hats.append(i)
-        assert depth >= 0
-    else:
-        assert hats
-        i = hats[0]
-        kwargs['hat'] = from_string(_strip_brackets(cat_str[i + 1:]))
-        return from_string(_strip_brackets(cat_str[:i]), **kwargs)
-
-
-def _strip_brackets(cat_str):
-    if not (cat_str.startswith('(') and cat_str.endswith(')')):
-        return cat_str
-    depth = 0
-    for c in cat_str:
-        if c == '(':
-            depth += 1
-        elif c == ')':
-            depth -= 1
-        if depth == 0 and (c == '/' or c == '\\' or c == '^'):
-            return cat_str
-    else:
-        return cat_str[1:-1]
+    return _make(tokens, values[i], **kwargs)
 
 
+def _make(tokens, *args, **kwargs):
+    """
+    A new Category, which keeps the lexicon it was parsed with
+    """
+    category = Category(*args, **kwargs)
+    object.__setattr__(category, '_lexicon', tokens.lexicon)
+    return category
@@ -1,8 +1,11 @@
 """
 A lexicon loaded from a markedup file
 """
+import cPickle
+import hashlib
 import os
 import os.path
+import threading
 from collections import defaultdict
 
 import ccg.category
@@ -10,23 +13,219 @@ import ccg.category
 _INIT_STR = "# now list the markedup categories" 
 DEFAULT_PATH = os.path.join(os.path.split(__file__)[0], 'markedup')
 CATS = {}
+# Lexical constraint groups of the loaded lexicon, e.g. '=aux'
+CONSTRAINT_GROUPS = {}
+# Bump when the pickled form of the lexicon changes
+SNAPSHOT_VERSION = 8
+FREQUENCIES_VERSION = 1
 
 
-def load(path=DEFAULT_PATH):
-    global CATS
-    CATS = _Lexicon(path)
+def load(path=DEFAULT_PATH, snapshot=True, lazy=False, entries=False):
+    """
+    Load the lexicon from a markedup file. If snapshot is set, the
+    parsed lexicon is restored from a snapshot next to the file,
+    which is rebuilt whenever the file's contents change. If lazy is
+    set, the file is only indexed, and each entry is parsed when it
+    is first looked up; no snapshot is used. If entries is set, the
+    full markedup entries and their GR slots are loaded too, except in
+    lazy mode. Supertag frequencies written next to the file with
+    write_frequencies are set in the lexicon's cats, by category ID.
+    """
+    global CATS, CONSTRAINT_GROUPS
+    lexicon = None
+    if lazy:
+        lexicon = LazyLexicon(path)
+        snapshot = False
+    elif snapshot:
+        digest = hashlib.sha1(open(path).read()).hexdigest()
+        lexicon = _read_snapshot(path, digest)
+        if lexicon is not None and entries and lexicon.entries is None:
+            lexicon = None
+    if lexicon is None:
+        lexicon = Lexicon(path, entries=entries)
+        if snapshot:
+            _write_snapshot(path, digest, lexicon)
+    if not lazy:
+        # Lexicon categories take the lowest IDs, in file order, and
+        # the IDs refer to this lexicon's categories from now on
+        for supertag in lexicon.supertags:
+            ccg.category.CATEGORIES.rebind(lexicon[supertag])
+    frequencies = read_frequencies(path)
+    if frequencies is not None:
+        lexicon.set_frequencies(frequencies)
+    CATS = lexicon
+    CONSTRAINT_GROUPS = lexicon.constraint_groups
+    # Interned categories may have been built from the old lexicon
+    ccg.category.INTERNED.clear()
 
-class _Lexicon(dict):
-    def __init__(self, path=DEFAULT_PATH):
-        dict.__init__(self)
-        self.cats = defaultdict(int)
-        for entry in self._split_entries(open(path).read()):
+
+def snapshot_path(path):
+    return path + '.snapshot'
+
+
+def _read_snapshot(path, digest):
+    """
+    The lexicon pickled for the given markedup contents, or None if
+    there is no usable snapshot
+    """
+    try:
+        version, snapshot_digest, lexicon = cPickle.load(
+            open(snapshot_path(path), 'rb'))
+    except Exception:
+        return None
+    if version != SNAPSHOT_VERSION or snapshot_digest != digest:
+        return None
+    return lexicon
+
+
+def _write_snapshot(path, digest, lexicon):
+    """
+    Pickle the lexicon next to the markedup file. Failing to write it,
+    e.g. in a read-only install, is not an error.
+    """
+    tmp_path = '%s.%d' % (snapshot_path(path), os.getpid())
+    try:
+        tmp_file = open(tmp_path, 'wb')
+        try:
+            cPickle.dump((SNAPSHOT_VERSION, digest, lexicon), tmp_file,
+                         cPickle.HIGHEST_PROTOCOL)
+        finally:
+            tmp_file.close()
+        os.rename(tmp_path, snapshot_path(path))
+    except (IOError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def frequencies_path(path):
+    return path + '.freqs'
+
+
+def read_frequencies(path):
+    """
+    The Frequencies written next to the markedup file, or None if
+    there are none
+    """
+    try:
+        version, frequencies = cPickle.load(
+            open(frequencies_path(path), 'rb'))
+    except Exception:
+        return None
+    if version != FREQUENCIES_VERSION:
+        return None
+    return frequencies
+
+
+def write_frequencies(path, frequencies):
+    """
+    Pickle corpus Frequencies next to the markedup file, so that
+    load can set them without re-reading the corpus
+    """
+    tmp_path = '%s.%d' % (frequencies_path(path), os.getpid())
+    tmp_file = open(tmp_path, 'wb')
+    try:
+        cPickle.dump((FREQUENCIES_VERSION, frequencies), tmp_file,
+                     cPickle.HIGHEST_PROTOCOL)
+    finally:
+        tmp_file.close()
+    os.rename(tmp_path, frequencies_path(path))
+
+
+class Frequencies(object):
+    """
+    Supertag counts from a corpus: overall, by word and by POS tag.
+    Counts from separate passes, e.g. over different files, are
+    combined with update.
+    """
+    def __init__(self):
+        self.supertags = defaultdict(int)
+        self.by_word = {}
+        self.by_pos = {}
+
+    def add(self, word, pos, supertag, count=1):
+        supertag = supertag.replace('[nb]', '')
+        self.supertags[supertag] += count
+        _add_count(self.by_word, word, supertag, count)
+        _add_count(self.by_pos, pos, supertag, count)
+
+    def update(self, other):
+        for supertag, count in other.supertags.iteritems():
+            self.supertags[supertag] += count
+        for table, other_table in ((self.by_word, other.by_word),
+                                   (self.by_pos, other.by_pos)):
+            for key, counts in other_table.iteritems():
+                for supertag, count in counts.iteritems():
+                    _add_count(table, key, supertag, count)
+        return self
+
+    def __len__(self):
+        """
+        The number of tokens counted
+        """
+        return sum(self.supertags.itervalues())
+
+
+def _add_count(table, key, supertag, count):
+    counts = table.get(key)
+    if counts is None:
+        counts = table[key] = defaultdict(int)
+    counts[supertag] += count
+
+
+class Lexicon(dict):
+    """
+    The categories of a markedup file, keyed by supertag and by
+    annotated string. A Lexicon can be passed to from_string, SuperCat
+    and CCGbank in place of the global CATS. Each has its own intern
+    table, and lookups are safe to share between threads.
+
+    If entries is set, the full MarkedupEntry for each supertag is kept
+    in entries, and the GR slots are indexed in slots, by (category ID,
+    slot number), and in slots_by_label, by GR label. Otherwise these
+    are None.
+    """
+    def __init__(self, path=DEFAULT_PATH, entries=False):
+        markedup = open(path).read()
+        self._init_state(markedup, entries)
+        for entry in self._split_entries(markedup):
             if not entry:
                 continue
             entry = entry.strip()
             supertag, annotated = self._parse_entry(entry)
             self.add_entry(supertag, annotated)
             self.add_entry(supertag.replace('[nb]', ''), annotated.replace('[nb]', ''))
+            if entries:
+                self.add_markedup(supertag, entry)
+
+    def _init_state(self, markedup, entries):
+        """
+        Set up an empty lexicon for a markedup file's text, before its
+        entries are added
+        """
+        dict.__init__(self)
+        # Corpus counts by category ID, see set_frequencies
+        self.cats = defaultdict(int)
+        # Supertags in the order they were added
+        self.supertags = []
+        self.interned = ccg.category.InternTable()
+        self._lock = threading.RLock()
+        # Lookups of bare categories missing from the lexicon
+        self.misses = defaultdict(int)
+        self._guesses = {}
+        self._skeletons = None
+        # Corpus counts, see set_frequencies
+        self.frequencies = None
+        self.constraint_groups = read_constraint_groups(markedup)
+        if entries:
+            self.entries = {}
+            self.slots = {}
+            self.slots_by_label = {}
+            self._entries_by_id = {}
+        else:
+            self.entries = None
+            self.slots = None
+            self.slots_by_label = None
+            self._entries_by_id = None
 
     def add_entry(self, supertag, annotated):
         annotated = annotated.split('@')[0]
@@ -38,14 +237,148 @@ class _Lexicon(dict):
         if '{R}' in annotated:
            return None 
         try:
-            category = ccg.category.from_string(annotated)
+            category = ccg.category.from_string(annotated, lexicon=self)
         except:
-            print entry
+            print annotated
             raise
         self[supertag] = category
         self[annotated] = category
-        # Allow frequencies to be set
-        self.cats[category] = 0
+        self.supertags.append(supertag)
+        # Lexicon categories take the lowest IDs, in file order
+        category_id = ccg.category.CATEGORIES.id_of(category)
+        # Counted by set_frequencies
+        self.cats[category_id] = 0
+
+    def add_markedup(self, supertag, markedup_str):
+        """
+        Keep the full entry for a supertag that was added, and index its
+        slots. Only the first entry for a category is indexed.
+        """
+        if supertag not in self:
+            return None
+        entry = MarkedupEntry(markedup_str, self)
+        bare = supertag.replace('[nb]', '')
+        if self.entries.setdefault(supertag, entry) is not entry:
+            return None
+        self.entries.setdefault(bare, entry)
+        category_id = self[supertag].id
+        if self._entries_by_id.setdefault(category_id, entry) is not entry:
+            return None
+        for n, slots in sorted(entry.grs.items()):
+            for slot in slots:
+                self.slots.setdefault((category_id, n), []).append(slot)
+                self.slots_by_label.setdefault(slot.label, []).append(
+                    (category_id, slot))
+        return entry
+
+    def guess(self, cat_str):
+        """
+        Guess the annotated string for a bare category string that is
+        missing from the lexicon. The annotation is taken from the entry
+        with the same skeleton whose features match best, keeping the
+        string's own features and hats. If there is none, the string is
+        annotated with default variables. Each call counts as a miss.
+        Strings that are already annotated, or have hats or conj, are
+        returned as they are.
+        """
+        if '{' in cat_str or '^' in cat_str or '[conj]' in cat_str:
+            return cat_str
+        with self._lock:
+            self.misses[cat_str] += 1
+            annotated = self._guesses.get(cat_str)
+            if annotated is None:
+                # Pass a kwarg, so from_string does not ask for a guess
+                bare = ccg.category.from_string(cat_str, lexicon=self,
+                                                top=False)
+                known = self._nearest(bare)
+                if known is None:
+                    annotated = bare.annotated
+                else:
+                    annotated = _transfer(known, bare).annotated
+                self._guesses[cat_str] = annotated
+        return annotated
+
+    def _nearest(self, category):
+        if self._skeletons is None:
+            skeletons = {}
+            for supertag in self.supertags:
+                known = self[supertag]
+                candidates = skeletons.setdefault(known.skeleton, [])
+                if not any(known is c for c in candidates):
+                    candidates.append(known)
+            self._skeletons = skeletons
+        feats = [feat for feat, hat in category.holes]
+        best = None
+        best_score = -1
+        for known in self._skeletons.get(category.skeleton, []):
+            score = len([1 for feat, (known_feat, hat) in
+                         zip(feats, known.holes) if feat == known_feat])
+            if score > best_score:
+                best = known
+                best_score = score
+        return best
+
+    def set_frequencies(self, frequencies):
+        """
+        Set the counts in cats, by category ID, from corpus Frequencies.
+        Feature variants such as N and N[num] are counted apart.
+        Supertags that are not in the lexicon are not counted.
+        """
+        with self._lock:
+            self.frequencies = frequencies
+            for category_id in self.cats:
+                self.cats[category_id] = 0
+            for supertag, count in frequencies.supertags.iteritems():
+                if supertag in self:
+                    self.cats[self[supertag].id] += count
+
+    def get_slots(self, category, n):
+        """
+        The GR slots for argument n of a category, or of a category ID
+        """
+        if isinstance(category, ccg.category.Category):
+            category = category.id
+        return self.slots.get((category, n), [])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['interned']
+        del state['_lock']
+        state['_skeletons'] = None
+        # Category IDs only hold in this process, so store the
+        # categories in their place, as TagDict does
+        category = ccg.category.CATEGORIES.__getitem__
+        state['cats'] = [(category(i), count)
+                         for i, count in self.cats.iteritems()]
+        if self.entries is not None:
+            state['slots'] = [(category(i), n, slots) for (i, n), slots
+                              in self.slots.iteritems()]
+            state['slots_by_label'] = [
+                (label, [(category(i), slot) for i, slot in pairs])
+                for label, pairs in self.slots_by_label.iteritems()]
+            state['_entries_by_id'] = [(category(i), entry) for i, entry
+                                       in self._entries_by_id.iteritems()]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.interned = ccg.category.InternTable()
+        self._lock = threading.RLock()
+        # Map the stored categories onto this process's IDs. Lexicon
+        # categories take the lowest IDs, in file order, as in add_entry
+        id_of = ccg.category.CATEGORIES.id_of
+        for supertag in self.supertags:
+            id_of(self[supertag])
+        self.cats = defaultdict(int, [(id_of(c), count)
+                                      for c, count in state['cats']])
+        if self.entries is not None:
+            self.slots = dict(((id_of(c), n), slots)
+                              for c, n, slots in state['slots'])
+            self.slots_by_label = dict(
+                (label, [(id_of(c), slot) for c, slot in pairs])
+                for label, pairs in state['slots_by_label'])
+            self._entries_by_id = dict((id_of(c), entry) for c, entry
+                                       in state['_entries_by_id'])
 
     def _split_entries(self, markedup):
         header, text = markedup.split(_INIT_STR)
@@ -58,8 +391,163 @@ class _Lexicon(dict):
         n_args, annotated = lines[1].strip().split()
         return supertag, annotated
 
+def _transfer(known, bare):
+    """
+    Rebuild a known category with the features of a bare one that has
+    the same skeleton, dropping its hats and conj
+    """
+    kwargs = known.kwargs
+    for name in ('feature', 'hat', 'conj'):
+        kwargs.pop(name, None)
+    if bare.feature:
+        kwargs['feature'] = bare.feature
+        kwargs.pop('feat_var', None)
+    if known.is_complex:
+        return ccg.category.Category(_transfer(known.result, bare.result),
+                                     known.slash,
+                                     _transfer(known.argument, bare.argument),
+                                     **kwargs)
+    return ccg.category.Category(known.cat, **kwargs)
+
+# Older name
+_Lexicon = Lexicon
+
+
+class LazyLexicon(Lexicon):
+    """
+    A lexicon that only indexes the markedup file, mapping each
+    supertag and annotated string to the offset of the entry's
+    annotated category. An entry is parsed when it is first looked up.
+    Iterating over the lexicon parses every entry.
+    """
+    def __init__(self, path=DEFAULT_PATH):
+        self._markedup = open(path).read()
+        self._init_state(self._markedup, False)
+        # Key to (start, end, strip [nb]) of the annotated string
+        self._index = {}
+        self._parsed = {}
+        offset = self._markedup.index(_INIT_STR) + len(_INIT_STR)
+        for entry in self._split_entries(self._markedup):
+            start = offset
+            offset += len(entry) + 2
+            if not entry:
+                continue
+            supertag, annotated = self._parse_entry(entry.strip())
+            annot_start = self._markedup.index(annotated, start)
+            annot_end = annot_start + len(annotated.split('@')[0])
+            self._index_entry(supertag, annotated,
+                              (annot_start, annot_end, False))
+            self._index_entry(supertag.replace('[nb]', ''),
+                              annotated.replace('[nb]', ''),
+                              (annot_start, annot_end, True))
+
+    def _index_entry(self, supertag, annotated, span):
+        """
+        Index an entry as add_entry would add it: the first entry
+        for a supertag wins
+        """
+        annotated = annotated.split('@')[0]
+        if supertag in self._index:
+            if annotated != self._annotated_string(self._index[supertag]):
+                return None
+        if '{R}' in annotated:
+            return None
+        self._index.setdefault(supertag, span)
+        self._index.setdefault(annotated, span)
+        self.supertags.append(supertag)
+
+    def _annotated_string(self, span):
+        start, end, strip_nb = span
+        annotated = self._markedup[start:end]
+        if strip_nb:
+            annotated = annotated.replace('[nb]', '')
+        return annotated
+
+    def __getitem__(self, key):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        span = self._index[key]
+        with self._lock:
+            category = self._parsed.get(span)
+            if category is None:
+                # Pass a kwarg, so from_string does not look the string
+                # up in this lexicon
+                category = ccg.category.from_string(
+                    self._annotated_string(span), lexicon=self, top=False)
+                self._parsed[span] = category
+                if self is CATS:
+                    category_id = ccg.category.CATEGORIES.rebind(category)
+                else:
+                    category_id = ccg.category.CATEGORIES.id_of(category)
+                self.cats[category_id] = 0
+            dict.__setitem__(self, key, category)
+        return category
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self._index
+
+    has_key = __contains__
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def _parse_all(self):
+        if dict.__len__(self) < len(self._index):
+            for key in self._index:
+                self[key]
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def iterkeys(self):
+        return iter(self._index)
+
+    def keys(self):
+        return self._index.keys()
+
+    def itervalues(self):
+        self._parse_all()
+        return dict.itervalues(self)
+
+    def iteritems(self):
+        self._parse_all()
+        return dict.iteritems(self)
+
+    def values(self):
+        self._parse_all()
+        return dict.values(self)
+
+    def items(self):
+        self._parse_all()
+        return dict.items(self)
+
+
+# Older name
+_LazyLexicon = LazyLexicon
+
+
+def read_constraint_groups(markedup):
+    """
+    The lexical constraint groups in a markedup file's header, as a
+    dict from names like '=aux' to sets of words. A group may be
+    spread over several lines.
+    """
+    groups = {}
+    header = markedup.split(_INIT_STR)[0]
+    for line in header.split('\n'):
+        if line.startswith('='):
+            pieces = line.split()
+            groups.setdefault(pieces[0], set()).update(pieces[1:])
+    return groups
+
+
 class MarkedupEntry(object):
-    def __init__(self, markedup_str):
+    def __init__(self, markedup_str, lexicon=None):
         self.string = markedup_str
         lines = [l for l in markedup_str.split('\n')
                 if not l.strip().startswith('#')]
@@ -69,30 +557,49 @@ class MarkedupEntry(object):
             alt_markedup = lines.pop(0)[4:]
         else:
             alt_markedup = ''
+        if lexicon is not None:
+            constraint_groups = lexicon.constraint_groups
+        else:
+            constraint_groups = CONSTRAINT_GROUPS
         slots = defaultdict(list)
         for line in lines:
-            slot = Slot(line)
+            slot = Slot(line, constraint_groups)
             slots[slot.n].append(slot)
 
-        self.category = ccg.category.from_string(bare_category)
-        self.annotated = ccg.category.from_string(annotated_category)
+        annotated_category = annotated_category.split('@')[0]
+        self.category = ccg.category.from_string(bare_category,
+                                                 lexicon=lexicon)
+        self.annotated = ccg.category.from_string(annotated_category,
+                                                  lexicon=lexicon)
         self.n_grs = int(n_slots)
         if alt_markedup:
-            self.alt_annotated = ccg.category.from_string(alt_markedup)
+            self.alt_annotated = ccg.category.from_string(alt_markedup,
+                                                          lexicon=lexicon)
         else:
             self.alt_annotated = self.annotated
         self.grs = slots
 
 
 class Slot(object):
-    def __init__(self, slot_str):
-        pieces = slot_str.strip().split(' ')
-        if pieces and pieces[-1].startswith('='):
-            self.constraint_name = pieces.pop(-1)
-            self.constraint_group = CONSTRAINT_GROUPS.get(self.constraint_name, set())
-        else:
-            self.constraint_name = None
-            self.constraint_group = set()
+    def __init__(self, slot_str, constraint_groups=None):
+        """
+        Constraints come at the end of the slot, and name either a
+        lexical constraint group or a category the filler must have
+        """
+        if constraint_groups is None:
+            constraint_groups = CONSTRAINT_GROUPS
+        # Drop any trailing comment
+        pieces = slot_str.split('#')[0].split()
+        self.constraint_name = None
+        self.constraint_group = set()
+        self.cat_constraint = None
+        while pieces and pieces[-1].startswith('='):
+            constraint = pieces.pop(-1)
+            if constraint in constraint_groups:
+                self.constraint_name = constraint
+                self.constraint_group = constraint_groups[constraint]
+            else:
+                self.cat_constraint = constraint[1:]
 
         if not pieces[-1].startswith('%') and pieces[-1] != 'ignore':
             self.subtype2 = pieces.pop(-1)
@@ -0,0 +1,253 @@
+"""
+Time category parsing, against the parser from_string replaced, and
+measure the memory held by categories, over the full markedup inventory.
+The isolated timing shows the single-pass parser on its own; any gain
+over the old parser comes from interning the pieces strings share.
+"""
+import re
+import sys
+import time
+
+import ccg.category
+import ccg.lexicon
+
+
+def markedup_strings(path=ccg.lexicon.DEFAULT_PATH):
+    """
+    Every bare and annotated category string in a markedup file
+    """
+    cat_strs = []
+    header, text = open(path).read().split(ccg.lexicon._INIT_STR)
+    for entry in text.split('\n\n'):
+        lines = [l.strip() for l in entry.strip().split('\n')
+                 if l.strip() and not l.startswith('#')]
+        if len(lines) < 2:
+            continue
+        cat_strs.append(lines[0])
+        cat_strs.append(lines[1].split()[1].split('@')[0])
+        if lines[2:] and lines[2].startswith('!'):
+            cat_strs.append(lines[2][1:].strip())
+    return cat_strs
+
+
+_old_var_re = re.compile(r'\{(\w)(?:,(\w))?(\*)?\}$')
+def old_from_string(cat_str, **kwargs):
+    """
+    The parser from_string replaced, which splits the string at its
+    top-level slash and re-scans each half. Kept to time against.
+    """
+    assert cat_str
+    assert cat_str.count('(') == cat_str.count(')')
+    cat_str = cat_str.replace('[nb]', '')
+    if not kwargs and cat_str in ccg.lexicon.CATS:
+        return ccg.lexicon.CATS[cat_str]
+    kwargs['top'] = False
+    if cat_str.endswith('>'):
+        kwargs['arg_idx'] = cat_str[-2]
+        cat_str = cat_str[:-3]
+    if cat_str.endswith('[conj]'):
+        kwargs['conj'] = True
+        cat_str = cat_str[:-6]
+        if cat_str in ccg.lexicon.CATS:
+            annotated = ccg.lexicon.CATS[cat_str].annotated
+            return old_from_string(annotated, **kwargs)
+    elif 'conj' not in kwargs:
+        kwargs['conj'] = False
+    hat_idx = cat_str.find('^')
+    if hat_idx != -1 and cat_str.endswith('{_}'):
+        assert 'hat' not in kwargs
+        base_str = cat_str[:hat_idx]
+        if base_str.count('(') == base_str.count(')'):
+            kwargs['hat'] = old_from_string(cat_str[hat_idx + 1:])
+            return old_from_string(base_str, **kwargs)
+    var_match = _old_var_re.search(cat_str)
+    if var_match is not None:
+        var = var_match.group(1)
+        var2 = var_match.group(2)
+        kwargs['asterisk'] = var_match.group(3)
+        kwargs['var'] = ccg.category.VARS.index(var)
+        if var2:
+            kwargs['var2'] = ccg.category.VARS.index(var2)
+        cat_str = _old_strip_brackets(cat_str[:var_match.start()])
+    if '/' not in cat_str and '\\' not in cat_str:
+        return _old_parse_atomic(cat_str, kwargs)
+    else:
+        return _old_parse_complex(cat_str, kwargs)
+
+
+def _old_parse_atomic(cat_str, kwargs):
+    if '^' in cat_str:
+        cat_str, hat_str = cat_str.split('^', 1)
+        kwargs['hat'] = old_from_string(hat_str)
+    assert cat_str
+    match = ccg.category._ATOMIC_RE.match(cat_str)
+    if match is None:
+        raise StandardError(cat_str)
+    atom, feature, conj = match.groups()
+    if feature:
+        if feature[1].isupper():
+            kwargs['feat_var'] = feature
+        else:
+            kwargs['feature'] = feature
+    return ccg.category.Category(atom, **kwargs)
+
+
+def _old_parse_complex(cat_str, kwargs):
+    depth = 0
+    slashes = set(('/', '\\'))
+    hats = []
+    for i, c in enumerate(cat_str):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif depth == 0:
+            if c in slashes:
+                result = old_from_string(_old_strip_brackets(cat_str[:i]))
+                slash = cat_str[i]
+                argument = old_from_string(
+                    _old_strip_brackets(cat_str[i + 1:]))
+                return ccg.category.Category(result, slash, argument,
+                                             **kwargs)
+            elif c == '^':
+                hats.append(i)
+        assert depth >= 0
+    else:
+        assert hats
+        i = hats[0]
+        kwargs['hat'] = old_from_string(_old_strip_brackets(cat_str[i + 1:]))
+        return old_from_string(_old_strip_brackets(cat_str[:i]), **kwargs)
+
+
+def _old_strip_brackets(cat_str):
+    if not (cat_str.startswith('(') and cat_str.endswith(')')):
+        return cat_str
+    depth = 0
+    for c in cat_str:
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        if depth == 0 and (c == '/' or c == '\\' or c == '^'):
+            return cat_str
+    else:
+        return cat_str[1:-1]
+
+
+def time_parse(cat_strs, parse=ccg.category.from_string, isolated=False,
+               repeat=5):
+    """
+    Best time to parse every string, with no lexicon and an empty
+    intern table, so that each category is really parsed. If isolated
+    is set, the intern table is also emptied before each string, so
+    that no pieces are shared between strings, as with the old parser.
+    """
+    ccg.lexicon.CATS = {}
+    best = None
+    for i in range(repeat):
+        ccg.category.INTERNED.clear()
+        start = time.time()
+        for cat_str in cat_strs:
+            if isolated:
+                ccg.category.INTERNED.clear()
+            parse(cat_str)
+        taken = time.time() - start
+        if best is None or taken < best:
+            best = taken
+    ccg.category.INTERNED.clear()
+    return best
+
+
+def category_nodes(categories):
+    """
+    Every distinct Category object reachable from the given ones,
+    including sub-categories and hats
+    """
+    seen = {}
+    stack = list(categories)
+    while stack:
+        category = stack.pop()
+        if category is None or id(category) in seen:
+            continue
+        seen[id(category)] = category
+        if category.is_complex:
+            stack.append(category.result)
+            stack.append(category.argument)
+        stack.append(category.hat)
+    return seen.values()
+
+
+def category_bytes(category):
+    """
+    Approximate bytes held by a single Category: the object itself,
+    its instance dict if it has one, and the containers it owns.
+    Strings and sub-categories are not counted, as they are shared.
+    """
+    total = sys.getsizeof(category)
+    attrs = getattr(category, '__dict__', None)
+    if attrs is not None:
+        total += sys.getsizeof(attrs)
+        if isinstance(attrs.get('kwargs'), dict):
+            total += sys.getsizeof(attrs['kwargs'])
+    for name in ('cats', 'cats_by_var', 'active_features'):
+        if attrs is not None:
+            mapping = attrs.get(name)
+        else:
+            # Lazy attributes: look in the slot, so as not to build them
+            mapping = getattr(category, '_' + name, None)
+        if mapping is None:
+            continue
+        elif isinstance(mapping, dict):
+            total += sys.getsizeof(mapping)
+            items = mapping.items()
+        else:
+            # A path view: count it and the sequences it has listed.
+            # The paths themselves are shared between categories.
+            total += sys.getsizeof(mapping) + sys.getsizeof(mapping.__dict__)
+            if mapping._items is not None:
+                total += sys.getsizeof(mapping._items)
+                for sequence in mapping._items:
+                    total += sys.getsizeof(sequence)
+            items = []
+        for key, value in items:
+            if isinstance(key, tuple):
+                total += sys.getsizeof(key)
+            if isinstance(value, list):
+                total += sys.getsizeof(value)
+    return total
+
+
+def memory_report(categories):
+    """
+    Number of Category nodes reachable from the given categories,
+    and the approximate bytes they hold
+    """
+    nodes = category_nodes(categories)
+    return len(nodes), sum(category_bytes(c) for c in nodes)
+
+
+def main(path=ccg.lexicon.DEFAULT_PATH):
+    cat_strs = markedup_strings(path)
+    times = {}
+    for name, parse, isolated in (('old parser', old_from_string, False),
+                                  ('new parser, isolated',
+                                   ccg.category.from_string, True),
+                                  ('new parser', ccg.category.from_string,
+                                   False)):
+        times[name] = taken = time_parse(cat_strs, parse, isolated)
+        print "Parsed %d categories in %.3fs (%s)" % (len(cat_strs), taken,
+                                                      name)
+    # The isolated run parses every piece itself, so it times the
+    # tokenizer against the old parser; the shared run adds interning
+    print "Single-pass parser alone: %.2fx the old parser's time" % (
+        times['new parser, isolated'] / times['old parser'])
+    print "With interning of shared pieces: %.2fx the old parser's time" % (
+        times['new parser'] / times['old parser'])
+    ccg.lexicon.load(path)
+    n_nodes, n_bytes = memory_report(set(ccg.lexicon.CATS.values()))
+    print "Lexicon holds %d category nodes in %d bytes (%d per node)" % (
+        n_nodes, n_bytes, n_bytes / n_nodes)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
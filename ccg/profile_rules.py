@@ -0,0 +1,77 @@
+"""
+Time Production over binary productions, from a grammar file such as
+CCGbank's wsjfull.grammar, or by default over pairs of lexicon
+categories, to measure rule application on SuperCats
+"""
+import random
+import sys
+import time
+
+import ccg.grammar
+import ccg.lexicon
+import ccg.rules
+import ccg.scat
+
+
+def binary_productions(path):
+    """
+    The (left, right, parent) strings of every binary production in a
+    grammar file whose children are in the lexicon
+    """
+    productions = []
+    for parent, left, right, freq in ccg.grammar.read(path):
+        if right is None:
+            continue
+        if left not in ccg.lexicon.CATS or right not in ccg.lexicon.CATS:
+            continue
+        productions.append((left, right, parent))
+    return productions
+
+
+def lexicon_productions(n=20000, seed=0):
+    """
+    The (left, right, None) strings of n pairs of lexicon supertags,
+    drawn with a fixed seed so that runs are comparable
+    """
+    supertags = sorted(set(ccg.lexicon.CATS.supertags))
+    rng = random.Random(seed)
+    return [(rng.choice(supertags), rng.choice(supertags), None)
+            for i in range(n)]
+
+
+def time_productions(productions, repeat=3):
+    """
+    Best time to build a Production for each, from fresh SuperCats,
+    and the number that found a valid rule
+    """
+    best = None
+    for i in range(repeat):
+        n_found = 0
+        start = time.time()
+        for left, right, parent in productions:
+            if parent is not None:
+                parent = ccg.scat.SuperCat(parent)
+            production = ccg.rules.Production(ccg.scat.SuperCat(left),
+                                              ccg.scat.SuperCat(right),
+                                              parent)
+            if production.rule != 'invalid':
+                n_found += 1
+        taken = time.time() - start
+        if best is None or taken < best:
+            best = taken
+    return best, n_found
+
+
+def main(path=None):
+    ccg.lexicon.load()
+    if path is None:
+        productions = lexicon_productions()
+    else:
+        productions = binary_productions(path)
+    taken, n_found = time_productions(productions)
+    print "Built %d of %d productions in %.3fs" % (n_found, len(productions),
+                                                   taken)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
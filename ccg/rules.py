@@ -52,25 +52,33 @@ class Production(object):
                                       self.rule)
 
     def get_rule(self, left, right, parent = None):
+        # Each combinator is tried in a trial, so the variables a
+        # rejected one binds on the operands are unbound again
         if right is None:
             assert parent
             unary_rules = [('traise', self.traise), ('unary', self.unary)]
             for rule, combinator in unary_rules:
-                result, depth = combinator(parent, left)
-                if result and parent.exact_eq(result):
-                    return rule, result, depth
+                with ccg.scat.trial() as trail:
+                    result, depth = combinator(parent, left)
+                    if result and parent.exact_eq(result):
+                        trail.commit()
+                        return rule, result, depth
             else:
                 return 'unary', None, 0
         for rule in self.combinators:
             combinator = getattr(self, rule)
-            result, depth = combinator(left, right)
-            if result and ((not parent) or parent.exact_eq(result)):
-                return rule, result, depth
+            with ccg.scat.trial() as trail:
+                result, depth = combinator(left, right)
+                if result and ((not parent) or parent.exact_eq(result)):
+                    trail.commit()
+                    return rule, result, depth
         else:
             if parent:
-                result, depth = self.binary(left, right, parent)
-                if result and parent.exact_eq(result):
-                    return 'binary', result, 0
+                with ccg.scat.trial() as trail:
+                    result, depth = self.binary(left, right, parent)
+                    if result and parent.exact_eq(result):
+                        trail.commit()
+                        return 'binary', result, 0
             return 'invalid', parent, 0
 
 
@@ -461,16 +469,20 @@ class Production(object):
 
     def _var_to_feats(self, cat1, cat2):
         """
-        Map feature variables to feature values for the unified pieces
+        Map feature variables to feature values for the unified pieces.
+        The paths are visited in sorted order, results before arguments,
+        and if a variable meets two features the first one wins: S[X]/S[X]
+        against S[em]/S[dcl] gives [em], and against (S[dcl]\NP)/(S[to]\NP)
+        gives [dcl].
         """
         c1_to_c2 = {}
         c2_to_c1 = {}
-        for path, sub1 in cat1.cats.items():
+        for path, sub1 in sorted(cat1.cats.items()):
             sub2 = cat2.cats[path]
             if sub1.feat_var and sub2.feature:
-                c1_to_c2[sub1.feat_var] = sub2.feature
+                c1_to_c2.setdefault(sub1.feat_var, sub2.feature)
             elif sub2.feat_var and sub1.feature:
-                c2_to_c1[sub2.feat_var] = sub1.feature
+                c2_to_c1.setdefault(sub2.feat_var, sub1.feature)
         return c1_to_c2, c2_to_c1
 
 class TypeChanging(object):
@@ -1,5 +1,9 @@
+from array import array
 from collections import defaultdict
+import contextlib
+import operator
 import re
+import threading
 
 import ccg.category
 import ccg.rules
@@ -10,21 +14,38 @@ class SuperCat(object):
     variable coindexation between a CCG category and HLDS terms.
     Tracks variable coindexation
     during productions. Unlike Category objects, is mutable.
+
+    The global variables are kept in arena, a VariableArena, or are
+    Variable objects if it is OBJECTS; by default, the active arena is
+    used. var_sets maps category vars to the global variable sets of
+    another scat in the same arena, which are shared, not copied: the
+    sets in a variable table are replaced, never changed in place.
     """
-    def __init__(self, category, hlds=None, word_bindings=None):
+    def __init__(self, category, hlds=None, word_bindings=None,
+                 lexicon=None, arena=None, var_sets=None):
         if isinstance(category, str):
-            category = ccg.category.from_string(category)
+            category = ccg.category.from_string(category, lexicon=lexicon)
         elif isinstance(category, SuperCat):
             category = category.category
         else:
             assert isinstance(category, ccg.category.Category)
         # Have a unique variable ID for each category variable.
         # Store the mapping from unique IDs to category vars and vice versa
+        # The IDs are Variable objects, or slots of the active arena
+        if arena is None:
+            arena = active_arena()
+        global_vars = OBJECTS if arena is None else arena
         var_table = {}
         for var in category.cats_by_var:
-            var_id = Variable()
-            var_table[var] = set([var_id])
+            if var_sets and var in var_sets:
+                var_table[var] = var_sets[var]
+            else:
+                var_table[var] = set([global_vars.new()])
         self._var_table = var_table
+        self._vars = global_vars
+        # Global variable values to category vars, see cats_at_global
+        self._index = None
+        self._index_epoch = -1
         self.category = category
         self.hlds_children = defaultdict(set)
         self.hlds_parents = defaultdict(set)
@@ -55,18 +76,56 @@ class SuperCat(object):
     def __repr__(self):
         return repr(self.category)
 
-    def global_annotated(self):
-        annotated = self.annotated.replace('*}', '}')
+    def global_annotated(self, _global_strs=None):
+        """
+        The annotated string, with each variable replaced by the words
+        bound to it, e.g. (S[dcl]{plays}\NP{Haag}<1>){plays}
+        """
+        if _global_strs is None:
+            _global_strs = {}
+        var_table = self._var_table
+        handle = self._vars.handle
+        global_strs = {}
+        clash = False
         for var in self.cats_by_var:
-            global_vars = [v for v in self._var_table[var] if v.word is not None]
-            try:
-                global_vars = sorted(global_vars, key=lambda gv: gv.word)
-            except:
-                raise
-            global_str = '{%s}' % ','.join(str(v) for v in global_vars)
-            var_str = ccg.category.VARS[var]
-            annotated = annotated.replace('{%s}' % var_str, global_str)
-        return annotated
+            var_set = var_table[var]
+            # Sets are shared between scats, so render each once
+            global_str = _global_strs.get(id(var_set))
+            if global_str is None and len(var_set) == 1:
+                global_var = handle(iter(var_set).next())
+                if global_var.word is None:
+                    global_str = '{}'
+                else:
+                    global_str = '{%s}' % global_var
+                _global_strs[id(var_set)] = global_str
+            elif global_str is None:
+                global_vars = [handle(v) for v in var_set]
+                global_vars = [v for v in global_vars if v.word is not None]
+                global_vars.sort(key=lambda gv: gv.word)
+                global_str = '{%s}' % ','.join(str(v) for v in global_vars)
+                _global_strs[id(var_set)] = global_str
+            if global_str != '{}' and _VAR_SLOT_RE.search(global_str):
+                clash = True
+            global_strs[var] = global_str
+        if clash:
+            # A word such as R renders as {R}, which is then replaced as
+            # if it were the variable R. Replace one variable at a time,
+            # in cats_by_var order, to give the same string as always.
+            annotated = self.annotated.replace('*}', '}')
+            for var in self.cats_by_var:
+                annotated = annotated.replace('{%s}' % ccg.category.VARS[var],
+                                              global_strs[var])
+            return annotated
+        literals, slots = _global_template(self.annotated)
+        pieces = [literals[0]]
+        for i, var in enumerate(slots):
+            global_str = global_strs.get(var)
+            if global_str is None:
+                # Not a variable of the category, e.g. in a conj string
+                global_str = '{%s}' % ccg.category.VARS[var]
+            pieces.append(global_str)
+            pieces.append(literals[i + 1])
+        return ''.join(pieces)
 
     def bind_vars(self, other, self_cat, other_cat):
         """
@@ -105,39 +164,143 @@ class SuperCat(object):
     def get_vars(self, cat=None):
         if cat is None:
             cat = self
-        return set(v.get_ref() for v in self._var_table[cat.var])
+        return self.var_globals(cat.var)
+
+    def var_globals(self, var):
+        """
+        The global variables bound to a category variable, as Variable
+        objects or arena views
+        """
+        global_vars = self._vars
+        return set(global_vars.handle(global_vars.find(v))
+                   for v in self._var_table[var])
 
     def add_var(self, i, var):
-        ref = var.get_ref()
-        self._var_table[i] = set(v.get_ref() for v in self._var_table[i])
-        self._var_table[i].add(ref)
+        global_vars = self._vars
+        find = global_vars.find
+        ref = find(global_vars.ref(var))
+        var_set = self._var_table[i]
+        for v in var_set:
+            if find(v) == ref:
+                return None
+        trail = active_trail()
+        if trail is not None:
+            trail.item(self._var_table, i)
+            self._index_epoch = -1
+        # The set may be shared, so replace it
+        var_set = set(var_set)
+        var_set.add(ref)
+        self._var_table[i] = var_set
+        if self._index_epoch == global_vars.epoch():
+            self._index.setdefault(global_vars.val(ref), set()).add(i)
+
+    def share_globals(self, var, other, other_var=None):
+        """
+        Bind a category variable to the global variables of another
+        scat's category variable. If the other scat keeps its variables
+        elsewhere, e.g. in a sentence's arena, this scat's are moved there
+        first.
+        """
+        if other_var is None:
+            other_var = var
+        if other._vars is not self._vars:
+            self._move_globals(other._vars)
+        trail = active_trail()
+        if trail is not None:
+            trail.item(self._var_table, var)
+        self._var_table[var] = other._var_table[other_var]
+        self._index = None
+        self._index_epoch = -1
+
+    def _move_globals(self, global_vars):
+        """
+        Replace the global variables with new ones in global_vars, an
+        arena or OBJECTS. Unified variables stay unified and keep their
+        word, but are no longer shared with scats in the old store.
+        """
+        old_vars = self._vars
+        new_refs = {}
+        new_sets = {}
+        var_table = {}
+        for var, var_set in self._var_table.items():
+            new_set = new_sets.get(id(var_set))
+            if new_set is None:
+                new_set = set()
+                for v in var_set:
+                    root = old_vars.val(v)
+                    ref = new_refs.get(root)
+                    if ref is None:
+                        ref = new_refs[root] = global_vars.new()
+                        word = old_vars.word(v)
+                        if word is not None:
+                            global_vars.handle(ref).word = word
+                    new_set.add(ref)
+                new_sets[id(var_set)] = new_set
+            var_table[var] = new_set
+        trail = active_trail()
+        if trail is not None:
+            trail.attr(self, '_var_table')
+            trail.attr(self, '_vars')
+        self._var_table = var_table
+        self._vars = global_vars
+        self._index = None
+        self._index_epoch = -1
 
     def unify_globals_at_var(self, other, var, other_var=None):
         if other_var is None:
             other_var = var
+        global_vars = self._vars
+        assert other._vars is global_vars
         s_vars = self._var_table[var]
         o_vars = other._var_table[other_var]
-        if len(s_vars) == len(o_vars) == 1:
-            list(s_vars)[0].unify(list(o_vars)[0])
-        else:
-            list(s_vars)[0].unify(list(o_vars)[0])
+        s_var = iter(s_vars).next()
+        o_var = iter(o_vars).next()
+        trail = active_trail()
+        if trail is not None:
+            # The patched index could not be rolled back
+            self._index_epoch = -1
+        indexed = self._index_epoch == global_vars.epoch()
+        if indexed:
+            old_vals = (global_vars.val(s_var), global_vars.val(o_var))
+        global_vars.union(s_var, o_var)
+        if not len(s_vars) == len(o_vars) == 1:
             # The unification is not complete here, which may cause problems.
             # But cannot unify other to both in self, or self vars will
             # be unified to each other :(
-            var_set = set([v.get_ref() for v in s_vars.union(o_vars)])
+            var_set = set([global_vars.find(v) for v in s_vars.union(o_vars)])
+            if trail is not None:
+                trail.item(self._var_table, var)
+                trail.item(other._var_table, other_var)
             self._var_table[var] = var_set
             other._var_table[other_var] = var_set
+            other._index = None
+            other._index_epoch = -1
+        else:
+            var_set = ()
+        if indexed:
+            # Merge the entries of the two unified values, and add the
+            # values var is now bound to
+            index = self._index
+            new_val = global_vars.val(s_var)
+            merged = index.setdefault(new_val, set())
+            for val in old_vals:
+                if val != new_val:
+                    merged.update(index.pop(val, ()))
+            for v in var_set:
+                index.setdefault(global_vars.val(v), set()).add(var)
+            self._index_epoch = global_vars.epoch()
 
     def can_unify(self, other, var, other_var):
+        word = self._vars.word
         s_vars = self._var_table[var]
-        s_words = set([s_var.word for s_var in s_vars])
+        s_words = set([word(s_var) for s_var in s_vars])
         o_vars = other._var_table[other_var]
         for s_var in s_vars:
-            s_word = s_var.word
+            s_word = word(s_var)
             if not s_word:
                 continue
             for o_var in o_vars:
-                o_word = o_var.word
+                o_word = word(o_var)
                 # Patch for conjunction, see wsj_0047.11 for eg
                 # May be bad idea?
                 if o_word and o_word not in s_words:
@@ -185,22 +348,38 @@ class SuperCat(object):
     def cats_at_global(self, global_var):
         """
         Find all cats whose vars map to this var's value.
-        Can't simply have a reverse index, because var's values change
-        on unification
-        """
-        cats = set()
-        val = global_var.val
-        for cat_var, var_set in self._var_table.items():
-            for var in var_set:
-                if var.val == val:
-                    for cat in self.cats_by_var[cat_var]:
-                        cats.add(cat)
-        return cats
+        Values change on unification, so the reverse index is rebuilt
+        when anything has been unified since it was built, except for
+        the unifications made through this scat, which patch it.
+        """
+        # Collect by identity: categories that compare equal can still
+        # sit at different variables
+        cats = {}
+        cats_by_var = self.cats_by_var
+        for cat_var in self._global_index().get(global_var.val, ()):
+            for cat in cats_by_var[cat_var]:
+                cats[id(cat)] = cat
+        return cats.values()
+
+    def _global_index(self):
+        global_vars = self._vars
+        epoch = global_vars.epoch()
+        if self._index_epoch != epoch:
+            index = {}
+            var_val = global_vars.val
+            for cat_var, var_set in self._var_table.iteritems():
+                for var in var_set:
+                    index.setdefault(var_val(var), set()).add(cat_var)
+            self._index = index
+            self._index_epoch = epoch
+        return self._index
 
     def all_globals(self):
         global_vars = set()
+        handle = self._vars.handle
+        find = self._vars.find
         for var_set in self._var_table.values():
-            global_vars.update(v.get_ref() for v in var_set)
+            global_vars.update(handle(find(v)) for v in var_set)
         return global_vars
 
     def map_letters_to_words(self):
@@ -272,6 +451,28 @@ class SuperCat(object):
         Create an annotated string referencing semantic roles, and
         markedup entries for the role dependencies
         """
+        n_args, stag_str, annotated, roles, leaf_str = self._srl_strings()
+        return n_args, stag_str, annotated, list(roles)
+
+    def srl_annotated(self):
+        """
+        The annotated string without argument numbers or asterisks,
+        then @ and the SRL triples, as in the last field of a .auto leaf
+        """
+        return self._srl_strings()[4]
+
+    def _srl_strings(self):
+        # The strings depend only on the category and srl_annot, so
+        # scats with the same supertag and roles share them. srl_annot
+        # is part of the key, so changing it is never served stale.
+        key = (self.string, self.annotated, frozenset(self.srl_annot))
+        strings = _SRL_STRINGS.get(key)
+        if strings is None:
+            strings = self._make_srl_strings()
+            _SRL_STRINGS[key] = strings
+        return strings
+
+    def _make_srl_strings(self):
         triple_strs = ["'".join(triple).replace('_', 'X') for triple in
                        self.srl_annot]
         triple_strs.sort()
@@ -325,26 +526,56 @@ class SuperCat(object):
         annotated = ''.join(reversed(annotated)) # Unreverse now that we're done
         # Append the @ annotation to the annotated string
         annotated = '%s@%s' % (annotated, stag_annot)
-        return len(var_to_args), stag_str, annotated, roles
+        leaf_str = '%s@%s' % (self.annot_strip_re.sub('', self.annotated)
+                              .replace('*', ''), stag_annot)
+        return len(var_to_args), stag_str, annotated, tuple(roles), leaf_str
     
     def srl_deps_from_annot(self):
         var_map = dict((var, i) for i, var in enumerate(ccg.category.VARS))
+        word = self._vars.word
         for head_var, label, child_var in sorted(self.srl_annot):
             head_globals = self._var_table[var_map[head_var]]
             child_globals = self._var_table[var_map[child_var]]
             for head_global in head_globals:
                 for child_global in child_globals:
-                    if head_global.word and child_global.word:
-                        yield head_global.word, label, child_global.word
+                    head_word = word(head_global)
+                    child_word = word(child_global)
+                    if head_word and child_word:
+                        yield head_word, label, child_word
+
+
+def _forward_category_attrs():
+    """
+    Give SuperCat a read-only property for each public Category
+    attribute it does not define itself, so that ccg.rules reads them
+    without a trip through __getattr__
+    """
+    for name in dir(ccg.category.Category):
+        if name.startswith('_') or hasattr(SuperCat, name):
+            continue
+        getter = operator.attrgetter('category.%s' % name)
+        setattr(SuperCat, name, property(getter))
+
+_forward_category_attrs()
 
 
 class Variable(object):
+    """
+    A global variable, shared between the categories of a derivation.
+    Unified variables form a disjoint set: each set has a root, which
+    holds the value and word of the whole set. Lookups compress the
+    path to the root, and unions attach the lower-ranked root.
+    """
+    __slots__ = ('_val', '_ref', '_word', '_rank')
     _next = 0
+    # Counts unions, which change values
+    _unions = 0
     def __init__(self):
         Variable._next += 1
         self._val = Variable._next
         self._ref = None
         self._word = None
+        self._rank = 0
 
     def __eq__(self, other):
         return self.val == other.val
@@ -368,13 +599,26 @@ class Variable(object):
 
     @word.setter
     def word(self, word):
-        self.get_ref()._word = word
+        ref = self.get_ref()
+        trail = active_trail()
+        if trail is not None:
+            trail.attr(ref, '_word')
+        ref._word = word
 
     def get_ref(self):
+        root = self
+        while root._ref is not None:
+            root = root._ref
+        # Point everything on the path straight at the root. During a
+        # trial the old links are recorded, as the root may be undone.
         var = self
-        while var._ref is not None:
-            var = var._ref
-        return var
+        if var._ref is not None and var._ref is not root:
+            trail = active_trail()
+            while var._ref is not root:
+                if trail is not None:
+                    trail.attr(var, '_ref')
+                var._ref, var = root, var._ref
+        return root
 
     def __str__(self):
         ref = self.get_ref()
@@ -396,11 +640,398 @@ class Variable(object):
         ### nicky_random_debugging_destruction - commented out:
         ### wsj_0023.3 (percent) breaks with this assert statement. 33 % of ...
         ### assert not (self_ref._word and other_ref._word)
+        # The unified set takes self's value, and self's word if it has
+        # one, whichever root it ends up under
+        val = self_ref._val
+        word = self_ref._word or other_ref._word
+        if self_ref._rank < other_ref._rank:
+            self_ref, other_ref = other_ref, self_ref
+        trail = active_trail()
+        if trail is not None:
+            for name in ('_rank', '_val', '_word'):
+                trail.attr(self_ref, name)
+            trail.attr(other_ref, '_ref')
+        if self_ref._rank == other_ref._rank:
+            self_ref._rank += 1
         other_ref._ref = self_ref
-        if other_ref._word and not self_ref._word:
-            self_ref._word = other_ref._word
-        if self_ref._word and not other_ref._word:
-            other_ref._word = self_ref._word
+        self_ref._val = val
+        self_ref._word = word
+        Variable._unions += 1
+
+
+class _Cache(object):
+    """
+    A dict of at most max_size entries, kept in two segments as
+    ccg.category.InternTable is: when the newer segment fills the older
+    one is dropped, and entries found in the older one move back.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._new = {}
+        self._old = {}
+
+    def __len__(self):
+        return len(self._new) + sum(1 for k in self._old
+                                    if k not in self._new)
+
+    def get(self, key):
+        value = self._new.get(key)
+        if value is None:
+            value = self._old.get(key)
+            if value is not None:
+                self[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if len(self._new) >= max(1, self.max_size // 2):
+            self._old = self._new
+            self._new = {}
+        self._new[key] = value
+
+    def clear(self):
+        self._new = {}
+        self._old = {}
+
+
+# srl_string pieces by supertag and frozen srl_annot, see _srl_strings
+_SRL_STRINGS = _Cache(10000)
+
+_GLOBAL_TEMPLATES = _Cache(10000)
+_VAR_SLOT_RE = re.compile(r'\{([%s])\}' %
+                          ''.join(re.escape(v) for v in ccg.category.VARS))
+
+def _global_template(annotated):
+    """
+    Split an annotated string, without asterisks, into the literal
+    text and the variables between them
+    """
+    template = _GLOBAL_TEMPLATES.get(annotated)
+    if template is None:
+        pieces = _VAR_SLOT_RE.split(annotated.replace('*}', '}'))
+        slots = tuple(ccg.category.VARS.index(v) for v in pieces[1::2])
+        template = (tuple(pieces[::2]), slots)
+        _GLOBAL_TEMPLATES[annotated] = template
+    return template
+
+
+def global_annotations(scats):
+    """
+    The global_annotated strings of many scats, e.g. the leaves of a
+    sentence, rendering each variable set they share once
+    """
+    global_strs = {}
+    return [scat.global_annotated(global_strs) for scat in scats]
+
+
+class _VariableObjects(object):
+    """
+    The default store of global variables, as Variable objects. Has the
+    same interface as VariableArena.
+    """
+    def new(self):
+        return Variable()
+
+    def find(self, var):
+        return var.get_ref()
+
+    def union(self, var, other):
+        var.unify(other)
+
+    def val(self, var):
+        return var.val
+
+    def word(self, var):
+        return var.word
+
+    def handle(self, var):
+        return var
+
+    def ref(self, var):
+        return var
+
+    def epoch(self):
+        return Variable._unions
+
+OBJECTS = _VariableObjects()
+
+
+class VariableArena(object):
+    """
+    The global variables of one sentence, in flat integer arrays: each
+    variable is a slot, with a parent, a rank and an index into words.
+    SuperCats made while an arena is active, see using_arena, hold slots
+    in their variable tables in place of Variable objects, and hand out
+    ArenaVariable views of them. Slots are numbered from 0 in each
+    arena, and the value of a set of unified slots is its root.
+    """
+    def __init__(self):
+        self.parents = array('i')
+        self.ranks = array('i')
+        self.word_ids = array('i')
+        self.words = []
+        self._word_ids = {}
+        self.unions = 0
+
+    def __len__(self):
+        return len(self.parents)
+
+    def new(self):
+        slot = len(self.parents)
+        self.parents.append(slot)
+        self.ranks.append(0)
+        self.word_ids.append(-1)
+        return slot
+
+    def find(self, slot):
+        parents = self.parents
+        root = slot
+        while parents[root] != root:
+            root = parents[root]
+        if parents[slot] != root:
+            trail = active_trail()
+            while parents[slot] != root:
+                if trail is not None:
+                    trail.item(parents, slot)
+                parents[slot], slot = root, parents[slot]
+        return root
+
+    val = find
+
+    def union(self, slot, other):
+        """
+        Unify two slots, as Variable.unify does: the set takes the
+        first slot's word if it has one
+        """
+        root = self.find(slot)
+        other_root = self.find(other)
+        trail = active_trail()
+        if trail is not None:
+            trail.arenas.add(self)
+        if root == other_root:
+            return None
+        word_id = self.word_ids[root]
+        if word_id == -1:
+            word_id = self.word_ids[other_root]
+        ranks = self.ranks
+        if ranks[root] < ranks[other_root]:
+            root, other_root = other_root, root
+        if trail is not None:
+            trail.item(ranks, root)
+            trail.item(self.word_ids, root)
+            trail.item(self.parents, other_root)
+        if ranks[root] == ranks[other_root]:
+            ranks[root] += 1
+        self.parents[other_root] = root
+        self.word_ids[root] = word_id
+        self.unions += 1
+
+    def epoch(self):
+        """
+        The number of unions so far, which change slot values
+        """
+        return self.unions
+
+    def word(self, slot):
+        word_id = self.word_ids[self.find(slot)]
+        return self.words[word_id] if word_id != -1 else None
+
+    def set_word(self, slot, word):
+        if word is None:
+            word_id = -1
+        else:
+            word_id = self._word_ids.get(id(word))
+            if word_id is None:
+                word_id = self._word_ids[id(word)] = len(self.words)
+                self.words.append(word)
+        root = self.find(slot)
+        trail = active_trail()
+        if trail is not None:
+            trail.item(self.word_ids, root)
+        self.word_ids[root] = word_id
+
+    def handle(self, slot):
+        return ArenaVariable(self, slot)
+
+    def ref(self, var):
+        """
+        The slot of an ArenaVariable of this arena, or of a slot
+        """
+        if isinstance(var, ArenaVariable):
+            assert var._arena is self
+            return var._slot
+        return var
+
+    def __getstate__(self):
+        return (self.parents, self.ranks, self.word_ids, self.words,
+                self.unions)
+
+    def __setstate__(self, state):
+        self.parents, self.ranks, self.word_ids, self.words, self.unions = \
+            state
+        self._word_ids = dict((id(word), i) for i, word in
+                              enumerate(self.words))
+
+
+class ArenaVariable(object):
+    """
+    A view of a slot in a VariableArena, with the interface of Variable
+    """
+    __slots__ = ('_arena', '_slot')
+    def __init__(self, arena, slot):
+        self._arena = arena
+        self._slot = slot
+
+    def __eq__(self, other):
+        return self.val == other.val
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __cmp__(self, other):
+        return cmp(self.val, other.val)
+
+    def __hash__(self):
+        return hash(self.val)
+
+    @property
+    def val(self):
+        return self._arena.find(self._slot)
+
+    @property
+    def word(self):
+        return self._arena.word(self._slot)
+
+    @word.setter
+    def word(self, word):
+        self._arena.set_word(self._slot, word)
+
+    def get_ref(self):
+        return ArenaVariable(self._arena, self._arena.find(self._slot))
+
+    def __str__(self):
+        word = self.word
+        if word:
+            return word.text
+        else:
+            return 'v%d' % self.val
+
+    def __repr__(self):
+        return str(self)
+
+    def unify(self, other):
+        self._arena.union(self._slot, self._arena.ref(other))
+
+
+# The active arena and trail of each thread
+_ACTIVE = threading.local()
+
+def active_arena():
+    """
+    The arena new SuperCats keep their variables in, or None
+    """
+    return getattr(_ACTIVE, 'arena', None)
+
+
+@contextlib.contextmanager
+def using_arena(arena):
+    """
+    Keep the variables of SuperCats made in the block in the arena.
+    If arena is None, they are Variable objects.
+    """
+    previous = active_arena()
+    _ACTIVE.arena = arena
+    try:
+        yield arena
+    finally:
+        _ACTIVE.arena = previous
+
+
+_MISSING = object()
+
+class Trail(object):
+    """
+    The changes made to global variables and variable tables during a
+    trial, so that they can be rolled back. See trial.
+    """
+    def __init__(self):
+        self.entries = []
+        self.arenas = set()
+        self.committed = False
+        self._outer = None
+
+    def __enter__(self):
+        self._outer = active_trail()
+        _ACTIVE.trail = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        outer = self._outer
+        _ACTIVE.trail = outer
+        if exc_type is not None or not self.committed:
+            self.rollback()
+        elif outer is not None:
+            outer.entries.extend(self.entries)
+            outer.arenas.update(self.arenas)
+        return False
+
+    def attr(self, obj, name):
+        """
+        Record an attribute before it is changed
+        """
+        self.entries.append((obj, name, getattr(obj, name), False))
+
+    def item(self, container, key):
+        """
+        Record an item of a dict or array before it is changed
+        """
+        if isinstance(container, dict):
+            old = container.get(key, _MISSING)
+        else:
+            old = container[key]
+        self.entries.append((container, key, old, True))
+
+    def commit(self):
+        """
+        Keep the changes when the trial ends
+        """
+        self.committed = True
+
+    def rollback(self):
+        """
+        Undo the changes, latest first
+        """
+        for target, key, old, is_item in reversed(self.entries):
+            if not is_item:
+                setattr(target, key, old)
+            elif old is _MISSING:
+                del target[key]
+            else:
+                target[key] = old
+        self.entries = []
+        # Values built during the trial are stale, so move the epochs on
+        Variable._unions += 1
+        for arena in self.arenas:
+            arena.unions += 1
+        self.arenas = set()
+
+
+def active_trail():
+    """
+    The trail of the trial in progress, or None
+    """
+    return getattr(_ACTIVE, 'trail', None)
+
+
+def trial():
+    """
+    A Trail to use in a with block. The unifications, word assignments
+    and variable table changes made in the block are recorded, and
+    rolled back when it ends, unless trail.commit() was called and it
+    did not raise. The changes of a committed trial inside another are
+    kept only if the outer one is. Path compressions are recorded
+    too, so that they are undone with the unions they followed.
+    """
+    return Trail()
 
 
 def replace_result(scat, new_res):
@@ -458,6 +1089,13 @@ def add_arg(result, slash, arg, revar=True, **kwargs):
         arg = change_kwarg(arg, var=result.next_var)
     category = ccg.category.Category(result, slash,
                                      arg, **kwargs)
+    sources = [(s, piece) for s, piece in ((result, category.result),
+                                           (arg, category.argument))
+               if hasattr(s, 'bind_vars')]
+    var_sets = _shared_var_sets(sources)
+    if var_sets is not None:
+        return SuperCat(category, arena=sources[0][0]._vars,
+                        var_sets=var_sets)
     new_scat = SuperCat(category)
     if hasattr(result, 'bind_vars'):
         new_scat.bind_vars(result, new_scat.result, result.category)
@@ -465,6 +1103,31 @@ def add_arg(result, slash, arg, revar=True, **kwargs):
         new_scat.bind_vars(arg, new_scat.argument, arg.category)
     return new_scat
 
+
+def _shared_var_sets(sources):
+    """
+    Map the vars of the pieces of a new category to the global variable
+    sets of the scats they are made from, given (scat, piece) pairs.
+    Sharing the sets binds the new vars as bind_vars would, without
+    making and unifying new variables. Returns None if there is nothing
+    to share, or if a var would need two sets, which must be unified.
+    """
+    if not sources:
+        return None
+    global_vars = sources[0][0]._vars
+    var_sets = {}
+    for scat, piece in sources:
+        if scat._vars is not global_vars:
+            return None
+        assert piece == scat.category
+        scat_cats = scat.category.cats
+        table = scat._var_table
+        for path, sub in piece.cats.iteritems():
+            var_set = table[scat_cats[path].var]
+            if var_sets.setdefault(sub.var, var_set) is not var_set:
+                return None
+    return var_sets
+
 def make_adjunct(cat, slash, force_dep=True):
     # Decide which category to base adjunct on
     if cat.is_complex:
@@ -489,6 +1152,9 @@ def change_kwarg(cat, **kwargs):
     new_cat = ccg.category.Category(cat.result, cat.slash, cat.argument,
                                     **cat_kwargs)
     if hasattr(cat, 'bind_vars'):
+        var_sets = _shared_var_sets([(cat, new_cat)])
+        if var_sets is not None:
+            return SuperCat(new_cat, arena=cat._vars, var_sets=var_sets)
         new_scat = SuperCat(new_cat)
         new_scat.bind_vars(cat, new_cat, cat.category)
         return new_scat
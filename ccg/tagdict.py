@@ -0,0 +1,127 @@
+"""
+A tag dictionary: the categories each word, or POS tag, was seen with
+"""
+import cPickle
+import os
+from array import array
+
+import ccg.category
+
+# Bump when the pickled form of TagDict changes
+VERSION = 1
+
+
+class TagDict(object):
+    """
+    Maps words, and POS tags as a backoff, to the IDs of the categories
+    they were seen with in a corpus, most frequent first, and their
+    counts. Words seen fewer than min_word_count times back off to their
+    POS tag. Built from the counts of ccg.lexicon.Frequencies, e.g. from
+    CCGbank.frequencies(); supertags are parsed with the given lexicon,
+    or the global one.
+
+    Each entry is a pair of arrays, so the dictionary stays compact.
+    Category IDs are those of ccg.category.CATEGORIES; a pickled
+    TagDict stores its categories, and maps them onto the IDs of the
+    process that loads it.
+    """
+    def __init__(self, frequencies, lexicon=None, min_word_count=1):
+        self.min_word_count = min_word_count
+        category_ids = {}
+        for supertag in frequencies.supertags:
+            category = ccg.category.from_string(supertag, lexicon=lexicon)
+            category_ids[supertag] = ccg.category.CATEGORIES.id_of(category)
+        self._words = _index(frequencies.by_word, category_ids)
+        self._tags = _index(frequencies.by_pos, category_ids)
+
+    def lookup(self, word, pos=None):
+        """
+        The category IDs and counts for a word, or for its POS tag if
+        the word is too rare and the tag was seen, as tuples. Both are
+        empty if neither was seen.
+        """
+        entry = self._words.get(word)
+        if entry is None or entry[0] < self.min_word_count:
+            entry = self._tags.get(pos, entry or _EMPTY)
+        # Copies, so that callers cannot change the stored entry
+        return tuple(entry[1]), tuple(entry[2])
+
+    def categories(self, word, pos=None):
+        """
+        The categories for a word, most frequent first
+        """
+        table = ccg.category.CATEGORIES
+        return [table[category_id] for category_id in
+                self.lookup(word, pos)[0]]
+
+    def __contains__(self, word):
+        return word in self._words
+
+    def __len__(self):
+        return len(self._words)
+
+    def __getstate__(self):
+        # Store the categories in place of this process's IDs
+        used = set()
+        for table in (self._words, self._tags):
+            for total, ids, counts in table.itervalues():
+                used.update(ids)
+        used = sorted(used)
+        local_ids = dict((category_id, i) for i, category_id in
+                         enumerate(used))
+        categories = [ccg.category.CATEGORIES[i] for i in used]
+        return (self.min_word_count, categories,
+                _remap(self._words, local_ids), _remap(self._tags, local_ids))
+
+    def __setstate__(self, state):
+        self.min_word_count, categories, words, tags = state
+        global_ids = ccg.category.CATEGORIES.merge(categories)
+        self._words = _remap(words, global_ids)
+        self._tags = _remap(tags, global_ids)
+
+
+_EMPTY = (0, array('i'), array('i'))
+
+
+def _index(table, category_ids):
+    """
+    Convert supertag counts by key into (total, ids, counts) entries
+    """
+    index = {}
+    for key, counts in table.iteritems():
+        pairs = sorted(((count, category_ids[supertag]) for supertag, count
+                        in counts.iteritems()), key=lambda p: (-p[0], p[1]))
+        index[key] = (sum(counts.itervalues()),
+                      array('i', [category_id for _, category_id in pairs]),
+                      array('i', [count for count, _ in pairs]))
+    return index
+
+
+def _remap(index, ids):
+    return dict((key, (total, array('i', [ids[i] for i in category_ids]),
+                       counts))
+                for key, (total, category_ids, counts) in index.iteritems())
+
+
+def save(tag_dict, path):
+    """
+    Pickle a TagDict to path
+    """
+    tmp_path = '%s.%d' % (path, os.getpid())
+    tmp_file = open(tmp_path, 'wb')
+    try:
+        cPickle.dump((VERSION, tag_dict), tmp_file, cPickle.HIGHEST_PROTOCOL)
+    finally:
+        tmp_file.close()
+    os.rename(tmp_path, path)
+
+
+def load(path):
+    """
+    Read a TagDict written by save
+    """
+    version, tag_dict = cPickle.load(open(path, 'rb'))
+    if version != VERSION:
+        raise ValueError('%s is a version %s tag dictionary, not %s' %
+                         (path, version, VERSION))
+    return tag_dict
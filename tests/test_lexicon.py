@@ -1,6 +1,16 @@
+import os
+import os.path
+import pickle
+import shutil
+import tempfile
+import threading
 import unittest
 
+import ccg.category
 import ccg.lexicon
+import ccg.scat
+import ccg.tagdict
+import Treebank.CCGbank
 
 class LexiconTests(unittest.TestCase):
     def test_entry(self):
@@ -34,6 +44,253 @@ class LexiconTests(unittest.TestCase):
         ccg.lexicon.load()
         cat = ccg.category.from_string('S[dcl]\NP')
         self.assertEqual(cat.annotated, '(S[dcl]{_}\NP{Y}<1>){_}')
+        # The IDs refer to the categories of the last load
+        ccg.lexicon.load()
+        cat = ccg.category.from_string(r'(S[dcl]\NP)/NP')
+        self.assertTrue(ccg.category.CATEGORIES[cat.id] is cat)
+        self.assertEqual(cat.id, ccg.category.CATEGORIES.get_id(cat))
+
+    def test_snapshot(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'markedup')
+            shutil.copy(ccg.lexicon.DEFAULT_PATH, path)
+            ccg.lexicon.load(path)
+            snapshot = ccg.lexicon.snapshot_path(path)
+            self.assertTrue(os.path.exists(snapshot))
+            built = ccg.lexicon.CATS
+            ccg.lexicon.load(path)
+            self.assertEqual(sorted(ccg.lexicon.CATS), sorted(built))
+            self.assertEqual(ccg.lexicon.CATS['NP'].annotated,
+                             built['NP'].annotated)
+            # Changing the markedup file makes the snapshot stale
+            markedup = open(path).read()
+            open(path, 'w').write(markedup + '\nZZ\n  0 ZZ{_}\n')
+            ccg.lexicon.load(path)
+            self.assertTrue('ZZ' in ccg.lexicon.CATS)
+        finally:
+            shutil.rmtree(tmp_dir)
+            ccg.lexicon.load()
+
+    def test_frequencies(self):
+        counts = ccg.lexicon.Frequencies()
+        counts.add('saw', 'VBD', r'(S[dcl]\NP)/NP')
+        counts.add('Vinken', 'NNP', 'NP[nb]')
+        other = ccg.lexicon.Frequencies()
+        other.add('saw', 'VBD', r'(S[dcl]\NP)/NP', count=2)
+        counts.update(other)
+        self.assertEqual(len(counts), 4)
+        self.assertEqual(counts.by_word['saw'][r'(S[dcl]\NP)/NP'], 3)
+        self.assertEqual(counts.by_pos['NNP']['NP'], 1)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'markedup')
+            shutil.copy(ccg.lexicon.DEFAULT_PATH, path)
+            ccg.lexicon.write_frequencies(path, counts)
+            ccg.lexicon.load(path)
+            lexicon = ccg.lexicon.CATS
+            self.assertEqual(lexicon.cats[lexicon[r'(S[dcl]\NP)/NP'].id], 3)
+            self.assertEqual(lexicon.cats[lexicon['N'].id], 0)
+            self.assertEqual(lexicon.frequencies.by_word['saw'],
+                             counts.by_word['saw'])
+        finally:
+            shutil.rmtree(tmp_dir)
+            ccg.lexicon.load()
+
+    def test_frequencies_features(self):
+        # Feature variants of a category are counted apart
+        counts = ccg.lexicon.Frequencies()
+        counts.add('shares', 'NNS', 'N', count=2)
+        counts.add('1', 'CD', 'N[num]', count=4)
+        lexicon = ccg.lexicon.Lexicon()
+        self.assertEqual(len(lexicon.cats), 603)
+        lexicon.set_frequencies(counts)
+        self.assertEqual(lexicon.cats[lexicon['N'].id], 2)
+        self.assertEqual(lexicon.cats[lexicon['N[num]'].id], 4)
+        self.assertEqual(sum(lexicon.cats.values()), 6)
+
+    def test_pickled_counts(self):
+        counts = ccg.lexicon.Frequencies()
+        counts.add('shares', 'NNS', 'N', count=2)
+        table = ccg.category.CATEGORIES
+        try:
+            ccg.category.CATEGORIES = ccg.category.CategoryTable()
+            ccg.category.CATEGORIES.id_of(ccg.category.Category('Q'))
+            lexicon = ccg.lexicon.Lexicon()
+            lexicon.set_frequencies(counts)
+            pickled = pickle.dumps(lexicon, pickle.HIGHEST_PROTOCOL)
+        finally:
+            ccg.category.CATEGORIES = table
+        restored = pickle.loads(pickled)
+        self.assertEqual(restored.cats[restored['N'].id], 2)
+        self.assertEqual(set(restored.cats),
+                         set(restored[s].id for s in restored.supertags))
+        self.assertTrue(max(restored.cats) < len(ccg.category.CATEGORIES))
+
+    def test_tag_dict(self):
+        counts = ccg.lexicon.Frequencies()
+        counts.add('saw', 'VBD', r'(S[dcl]\NP)/NP', count=3)
+        counts.add('saw', 'VBD', r'S[dcl]\NP')
+        counts.add('ran', 'VBD', r'S[dcl]\NP')
+        tag_dict = ccg.tagdict.TagDict(counts, min_word_count=2)
+        transitive = ccg.category.from_string(r'(S[dcl]\NP)/NP')
+        intransitive = ccg.category.from_string(r'S[dcl]\NP')
+        ids, freqs = tag_dict.lookup('saw', 'VBD')
+        self.assertEqual(list(ids), [transitive.id, intransitive.id])
+        self.assertEqual(list(freqs), [3, 1])
+        # Rare and unseen words back off to the POS tag
+        self.assertEqual(list(tag_dict.lookup('ran', 'VBD')[1]), [3, 2])
+        self.assertEqual(list(tag_dict.lookup('walked', 'VBD')[1]), [3, 2])
+        self.assertEqual(list(tag_dict.lookup('walked', 'NN')[0]), [])
+        # Tuples, so callers cannot change the stored entry
+        self.assertEqual(ids, (transitive.id, intransitive.id))
+        copied = pickle.loads(pickle.dumps(tag_dict, 2))
+        self.assertEqual(copied.categories('saw'), [transitive, intransitive])
+
+    def test_count_tokens(self):
+        # Counted as CCGFile reads them, without the mmccg dots
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'wsj_0001.auto')
+            open(path, 'w').write(
+                'ID=wsj_0001.1 PARSER=GOLD NUMPARSE=1\n'
+                '(<T S[dcl] 0 2> (<L S[dcl]\\.NP VBZ VBZ plays '
+                'S[dcl]\\NP_241>) (<L NP NNP NNP Elianti NP>) )\n')
+            counts = Treebank.CCGbank._CCGbank.countTokens(path)
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(dict(counts.by_word['plays']), {r'S[dcl]\NP': 1})
+        self.assertEqual(len(counts), 2)
+
+    def test_lazy(self):
+        eager = ccg.lexicon._Lexicon()
+        lazy = ccg.lexicon._LazyLexicon()
+        self.assertEqual(dict.__len__(lazy), 0)
+        self.assertTrue('(S[dcl]\NP)/NP' in lazy)
+        cat = lazy['(S[dcl]\NP)/NP']
+        # Only the entry and the entries its pieces are looked up in,
+        # in this lexicon, are built
+        self.assertEqual(sorted(dict.keys(lazy)),
+                         ['(S[dcl]\NP)/NP', '(S[dcl]{_}\NP{Y}<1>){_}',
+                          'S[dcl]{_}'])
+        self.assertEqual(cat.annotated, eager['(S[dcl]\NP)/NP'].annotated)
+        self.assertTrue(lazy[cat.annotated] is cat)
+        self.assertEqual(sorted(lazy.keys()), sorted(eager.keys()))
+        for key, cat in lazy.items():
+            self.assertEqual(cat.annotated, eager[key].annotated)
+
+    def test_instances(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'markedup')
+            markedup = open(ccg.lexicon.DEFAULT_PATH).read()
+            open(path, 'w').write(markedup + '\nZZ\n  0 ZZ{_}\n')
+            original = ccg.lexicon.Lexicon()
+            extended = ccg.lexicon.Lexicon(path)
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertTrue(ccg.category.from_string('ZZ', lexicon=extended)
+                        is extended['ZZ'])
+        self.assertFalse('ZZ' in original)
+        n_global = len(ccg.category.INTERNED)
+        n_interned = len(original.interned)
+        cat = ccg.category.from_string(r'(S[dcl]\NP)/(PP/NP)',
+                                       lexicon=original)
+        self.assertTrue(len(original.interned) > n_interned)
+        self.assertEqual(len(ccg.category.INTERNED), n_global)
+        supercat = ccg.scat.SuperCat(r'(S[dcl]\NP)/(PP/NP)',
+                                     lexicon=original)
+        self.assertTrue(supercat.category is cat)
+
+    def test_instances_render(self):
+        # Rendering and comparing a private lexicon's categories leaves
+        # the global lexicon and intern table alone
+        lexicon = ccg.lexicon.Lexicon()
+        n_global = len(ccg.category.INTERNED)
+        misses = dict(ccg.lexicon.CATS.misses)
+        cat = ccg.category.from_string(r'(S[dcl]\NP)/(PP/NP)',
+                                       lexicon=lexicon)
+        conj = ccg.category.from_string(r'(S[dcl]\NP)/NP[conj]',
+                                        lexicon=lexicon)
+        self.assertTrue(cat == r'(S\NP)/(PP/NP)')
+        self.assertFalse(cat == r'(S\NP)/(NP/NP)')
+        self.assertEqual(conj.string, r'(S[dcl]\NP)/NP[conj]')
+        self.assertTrue(cat.result._lexicon is lexicon)
+        self.assertEqual(len(ccg.category.INTERNED), n_global)
+        self.assertEqual(dict(ccg.lexicon.CATS.misses), misses)
+
+    def test_threads(self):
+        lexicon = ccg.lexicon.LazyLexicon()
+        keys = lexicon.keys()
+        results = []
+        def look_up():
+            results.append([lexicon[key] for key in keys])
+        threads = [threading.Thread(target=look_up) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 4)
+        for cats in results[1:]:
+            self.assertTrue(all(c1 is c2 for c1, c2 in zip(results[0], cats)))
+
+    def test_entries(self):
+        lexicon = ccg.lexicon.Lexicon(entries=True)
+        self.assertEqual(lexicon.constraint_groups['=det'],
+                         set(['another', 'other', 'some', 'such']))
+        self.assertTrue('can' in lexicon.constraint_groups['=aux'])
+        entry = lexicon.entries['(S[dcl]\NP)/(S[b]\NP)']
+        self.assertTrue(entry.category is lexicon['(S[dcl]\NP)/(S[b]\NP)'])
+        self.assertEqual(entry.alt_annotated.annotated,
+                         '((S[dcl]{Z}\NP{Y}<1>){Z}/(S[b]{Z}<2>\NP{Y*}){Z}){_}')
+        slots = lexicon.get_slots(entry.category, 1)
+        self.assertEqual([s.label for s in slots], ['ignore', 'ncsubj'])
+        self.assertEqual(slots[0].constraint_name, '=aux')
+        self.assertEqual(slots[1].words, ['%l', '%f'])
+        self.assertTrue((entry.category.id, entry.grs[2][0])
+                        in lexicon.slots_by_label['aux'])
+
+    def test_pickled_ids(self):
+        # Pickle a lexicon made in a "process" whose IDs differ
+        table = ccg.category.CATEGORIES
+        try:
+            ccg.category.CATEGORIES = ccg.category.CategoryTable()
+            ccg.category.CATEGORIES.id_of(ccg.category.Category('Q'))
+            lexicon = ccg.lexicon.Lexicon(entries=True)
+            pickled = pickle.dumps(lexicon, pickle.HIGHEST_PROTOCOL)
+        finally:
+            ccg.category.CATEGORIES = table
+        restored = pickle.loads(pickled)
+        category = restored[r'(S[dcl]\NP)/(S[b]\NP)']
+        self.assertEqual([s.label for s in restored.get_slots(category, 1)],
+                         ['ignore', 'ncsubj'])
+        self.assertTrue(restored._entries_by_id[category.id] is
+                        restored.entries[r'(S[dcl]\NP)/(S[b]\NP)'])
+        self.assertTrue((category.id, restored.entries[
+            r'(S[dcl]\NP)/(S[b]\NP)'].grs[2][0]) in
+                        restored.slots_by_label['aux'])
+
+    def test_slot_constraints(self):
+        groups = {'=be': set(['is'])}
+        slot = ccg.lexicon.Slot('  2 xcomp %f %l %c =be =PP/NP', groups)
+        self.assertEqual(slot.constraint_name, '=be')
+        self.assertEqual(slot.cat_constraint, 'PP/NP')
+        self.assertEqual(slot.words, ['%f', '%l', '%c'])
+        slot = ccg.lexicon.Slot('  2 ignore # a comment', groups)
+        self.assertEqual((slot.n, slot.label), (2, 'ignore'))
+
+    def test_guess(self):
+        lexicon = ccg.lexicon.Lexicon()
+        cat_str = r'PP/(S[to]\NP)'
+        self.assertTrue(cat_str not in lexicon)
+        category = ccg.category.from_string(cat_str, lexicon=lexicon)
+        self.assertEqual(category.annotated,
+                         r'(PP{_}/(S[to]{Y}<1>\NP{Z}){Y}){_}')
+        self.assertTrue(ccg.category.from_string(cat_str, lexicon=lexicon)
+                        is category)
+        self.assertEqual(lexicon.misses[cat_str], 2)
+        self.assertEqual(lexicon.guess('Q/R'), '(Q{_}/R{_}){_}')
+        self.assertTrue('NP' not in lexicon.misses)
 
 
 if __name__ == '__main__':
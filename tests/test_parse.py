@@ -1,3 +1,4 @@
+import pickle
 import unittest
 import ccg
 import ccg.category
@@ -109,8 +110,98 @@ class TestComplex(unittest.TestCase):
         cat_str = r'PP/(S[to]\NP)'
         assert cat_str not in ccg.lexicon.CATS
         cat = ccg.category.from_string(r'PP/(S[to]\NP)')
-        # Need to fix this somehow
-        assert cat.annotated != r'(PP{_}/(S[to]{_}\NP{Y}<1>){_}){_}'
+        assert cat.annotated == r'(PP{_}/(S[to]{Y}<1>\NP{Z}){Y}){_}'
+
+class TestSyntaxErrors(unittest.TestCase):
+    def test_positions(self):
+        cases = [('(S[dcl]\\NP', 0), ('NP)', 2), ('S[dcl]/', 7),
+                 ('NP/N#', 4), ('(S\\NP){X}', 6)]
+        for cat_str, position in cases:
+            try:
+                ccg.category.from_string(cat_str)
+            except ccg.category.CategorySyntaxError as error:
+                self.assertEqual(error.position, position)
+            else:
+                self.fail(cat_str)
+
+    def test_is_value_error(self):
+        self.assertRaises(ValueError, ccg.category.from_string, '')
+
+
+class TestInterning(unittest.TestCase):
+    def test_shared(self):
+        c1 = ccg.category.from_string(r'((S[b]\NP)/PP)/(S[to]\NP)')
+        c2 = ccg.category.from_string(r'((S[b]\NP)/PP)/(S[to]\NP)')
+        self.assertTrue(c1 is c2)
+        c3 = ccg.category.from_string(r'(S[b]\NP)/PP')
+        self.assertTrue(c1.result is c3)
+
+    def test_canonical(self):
+        c1 = ccg.category.from_string('N{_}')
+        c2 = ccg.category.from_string('N[nb]')
+        self.assertTrue(c1 is c2)
+
+    def test_counts(self):
+        table = ccg.category.INTERNED
+        misses = table.misses
+        hits = table.hits
+        ccg.category.from_string(r'(PP\PP)/(S[ng]\NP[conj])')
+        self.assertTrue(table.misses > misses)
+        hits = table.hits
+        ccg.category.from_string(r'(PP\PP)/(S[ng]\NP[conj])')
+        self.assertEqual(table.hits, hits + 1)
+
+    def test_max_size(self):
+        table = ccg.category.InternTable(max_size=4)
+        cats = {}
+        for cat_str in ['NP', 'N', 'PP', 'S']:
+            cats[cat_str] = ccg.category.from_string(cat_str)
+            table.add((cat_str, ()), cats[cat_str])
+        self.assertEqual(len(table), 4)
+        # NP is used again, so it outlives N when the segments turn over
+        self.assertTrue(table.get(('NP', ())) is cats['NP'])
+        table.add(('S[dcl]', ()), ccg.category.from_string('S[dcl]'))
+        self.assertTrue(table.get(('N', ())) is None)
+        self.assertTrue(table.get(('NP', ())) is cats['NP'])
+        self.assertTrue(table.get(('S', ())) is cats['S'])
+        self.assertTrue(len(table) <= 4)
+        # A category whose lookup was dropped is still shared by form
+        self.assertTrue(table.add(('NP{_}', ()),
+                                  ccg.category.from_string('NP{_}'))
+                        is cats['NP'])
+
+    def test_batch(self):
+        cat_strs = [r'(S[dcl]\NP)/NP', 'NP', r'(S[dcl]\NP)/NP', 'NP[nb]',
+                    r'((S[dcl]\NP)/NP)/PP']
+        cats, index = ccg.category.from_strings(cat_strs)
+        self.assertEqual(len(cats), 3)
+        self.assertEqual(list(index), [0, 1, 0, 1, 2])
+        self.assertTrue(cats[2].result is cats[0])
+
+
+class TestCategoryTable(unittest.TestCase):
+    def test_ids(self):
+        c = ccg.category.from_string(r'(S[dcl]\NP)/NP')
+        self.assertTrue(ccg.category.CATEGORIES[c.id] is c)
+        self.assertEqual(ccg.lexicon.CATS['NP'].id,
+                         ccg.category.CATEGORIES.get_id(
+                            ccg.category.from_string('NP')))
+
+    def test_pickle_and_merge(self):
+        table = ccg.category.CategoryTable()
+        for cat_str in ['NP', r'S[dcl]\NP', r'(S[dcl]\NP)/NP']:
+            table.id_of(ccg.category.from_string(cat_str))
+        copied = pickle.loads(pickle.dumps(table))
+        self.assertEqual(len(copied), 3)
+        self.assertEqual(copied.get_id(ccg.category.from_string('NP')), 0)
+        merged = ccg.category.CategoryTable(
+            [ccg.category.from_string('PP')])
+        remap = merged.merge(copied)
+        self.assertEqual(list(remap), [1, 2, 3])
+        self.assertEqual(merged[remap[2]].string, r'(S[dcl]\NP)/NP')
+        self.assertEqual(len(pickle.loads(pickle.dumps(
+            ccg.category.CategoryTable()))), 0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -215,6 +215,35 @@ class TestRules(unittest.TestCase):
         parent = ccg.scat.SuperCat('S[pss]\NP')
         production = ccg.rules.Production(c1, c2, parent)
 
+    def test_inner_slashes(self):
+        # The argument's inner slash differs from the functor's, which
+        # category equality has never checked
+        production = ccg.rules.Production(
+            ccg.scat.SuperCat(r'S[wq]\(S[dcl]/NP)'),
+            ccg.scat.SuperCat(r'(S\(S\NP))\(S\(S\NP))'))
+        self.assertEqual(production.rule, 'bapply')
+        self.assertEqual(production.result.string, r'S[wq]\(S[wq]\NP)')
+        production = ccg.rules.Production(
+            ccg.scat.SuperCat(r'S/(S\(S[dcl]\NP))'),
+            ccg.scat.SuperCat(r'(S[wq]\(S[dcl]/NP))/N'))
+        self.assertEqual(production.rule, 'ftraise_comp')
+        self.assertEqual(production.result.string, r'S[wq]/N')
+
+    def test_feature_clash(self):
+        # A variable bound to two features takes the first one in path
+        # order, so the result's
+        production = ccg.rules.Production(
+            ccg.scat.SuperCat(r'S[em]/S[dcl]'),
+            ccg.scat.SuperCat(r'(S/S)\(S/S)'))
+        self.assertEqual(production.rule, 'badjunct')
+        self.assertEqual(production.result.string, r'S[em]/S[em]')
+        production = ccg.rules.Production(
+            ccg.scat.SuperCat(r'(S[dcl]\NP)/(S[to]\NP)'),
+            ccg.scat.SuperCat(r'((S\NP)/(S\NP))\((S\NP)/(S\NP))'))
+        self.assertEqual(production.rule, 'badjunct')
+        self.assertEqual(production.result.string,
+                         r'(S[dcl]\NP)/(S[dcl]\NP)')
+
     def test_parent_annotation(self):
         c1 = ccg.scat.SuperCat('((S[dcl]\NP)/(S[to]\NP))/NP')
         c2 = ccg.scat.SuperCat('NP')
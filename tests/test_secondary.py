@@ -1,3 +1,4 @@
+import pickle
 import unittest
 
 import ccg.category
@@ -56,6 +57,77 @@ class TestSecondary(unittest.TestCase):
         self.assertFalse(c.is_true_aux)
 
 
+    def test_immutable(self):
+        c = ccg.category.from_string(r'((S\NP)\(S\NP))/NP')
+        self.assertRaises(AttributeError, setattr, c, 'has_adjunct', False)
+        self.assertTrue(c.has_adjunct)
+        self.assertRaises(AttributeError, setattr, c, 'has_adjunct', False)
+        self.assertRaises(AttributeError, setattr, c, 'slash', '\\')
+
+    def test_pickle(self):
+        c = ccg.category.from_string(r'(S[dcl]\NP)/(S[b]\NP)')
+        self.assertFalse(hasattr(c, '__dict__'))
+        copied = pickle.loads(pickle.dumps(c, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(copied.annotated, c.annotated)
+        self.assertEqual(copied.kwargs, c.kwargs)
+        self.assertTrue(c.exact_eq(copied))
+
+    def test_exact_key(self):
+        c1 = ccg.category.from_string(r'(S[dcl]\NP[nb])/NP')
+        c2 = ccg.category.from_string(r'(S[dcl]\NP)/NP')
+        c3 = ccg.category.from_string(r'(S[b]\NP)/NP')
+        self.assertTrue(c1.exact_eq(c2))
+        self.assertFalse(c1.exact_eq(c3))
+        self.assertEqual(c1.exact_key, c2.exact_key)
+        self.assertNotEqual(c1.exact_key, c3.exact_key)
+        conj = ccg.category.from_string(r'(S[dcl]\NP)/NP[conj]')
+        self.assertFalse(c2.exact_eq(conj))
+
+    def test_skeleton_eq(self):
+        c = ccg.category.from_string(r'(S[dcl]\NP)/NP')
+        self.assertEqual(c.skeleton, r'(S\NP)/NP')
+        self.assertTrue(c == r'(S\NP)/NP')
+        self.assertTrue(c == r'(S[dcl]\NP)/NP')
+        self.assertFalse(c == r'(S[b]\NP)/NP')
+        self.assertFalse(c == r'(S\NP)\NP')
+        self.assertFalse(c == None)
+        # Only the top slash is compared, as it always was
+        self.assertEqual(c.shape, r'(S|NP)/NP')
+        self.assertTrue(c == r'(S/NP)/NP')
+        self.assertTrue(ccg.category.from_string(r'S[wq]\(S[dcl]/NP)') ==
+                        r'S\(S\NP)')
+
+    def test_hash_matches_eq(self):
+        pairs = [(r'S[dcl]', 'S'), (r'(S[dcl]\NP)/NP', r'(S\NP)/NP'),
+                 (r'(S\NP)/NP', r'(S/NP)/NP'), ('N[num]', 'N'),
+                 (r'S[dcl]\NP', r'S[b]\NP'), ('NP', 'N')]
+        for s1, s2 in pairs:
+            c1 = ccg.category.from_string(s1)
+            c2 = ccg.category.from_string(s2)
+            if c1 == c2 or c2 == c1:
+                self.assertEqual(hash(c1), hash(c2))
+        # Feature variants that are not equal stay apart as keys
+        c1 = ccg.category.from_string(r'(S[dcl]\NP)/NP')
+        c2 = ccg.category.from_string(r'(S[dcl]\NP[nb])/NP')
+        c3 = ccg.category.from_string(r'(S[b]\NP)/NP')
+        self.assertEqual(len(set([c1, c2, c3])), 2)
+        counts = {c1: 2, c3: 4}
+        self.assertEqual(counts[c2], 2)
+        self.assertEqual(counts[c3], 4)
+        self.assertEqual(hash(ccg.scat.SuperCat(c1)), hash(c1))
+
+    def test_paths(self):
+        c = ccg.category.from_string(r'((S[dcl]\NP)/PP)/NP')
+        self.assertEqual(len(c.cats), 7)
+        self.assertEqual(c.cats[(0, 0, 0)].string, 'S[dcl]')
+        self.assertEqual(c.cats[(0, 0)].string, r'S[dcl]\NP')
+        self.assertTrue((1,) in c.cats)
+        self.assertFalse((1, 0) in c.cats)
+        self.assertRaises(KeyError, c.cats.__getitem__, (2,))
+        self.assertEqual(c.cats.keys()[:3], [(), (0,), (0, 0)])
+        self.assertEqual(c.active_features.keys(), [(0, 0, 0)])
+        self.assertTrue(c.cats_by_var[0][0] is c)
+
     def test_srl_annot_string(self):
         stag = ccg.scat.SuperCat('(S[dcl]\NP)/NP')
         stag.srl_annot.add(('_', 'A0', 'Y'))
@@ -67,6 +139,35 @@ class TestSecondary(unittest.TestCase):
                          "((S[dcl]{_}\\NP{Y}<1>){_}/NP{Z}<2>){_}@X'A0'Y_Z'AM-TMP'X")
         assert roles == ['1 A0 %l %f', '2 AM-TMP %f %l']
 
+    def test_srl_annotated(self):
+        stag = ccg.scat.SuperCat('(S[dcl]\NP)/NP')
+        self.assertEqual(stag.srl_annotated(),
+                         "((S[dcl]{_}\\NP{Y}){_}/NP{Z}){_}@")
+        stag.add_srl_annot_from_srl_string("X'A0'Y")
+        self.assertEqual(stag.srl_annotated(),
+                         "((S[dcl]{_}\\NP{Y}){_}/NP{Z}){_}@X'A0'Y")
+        # Scats with the same supertag and roles share the strings
+        other = ccg.scat.SuperCat('(S[dcl]\NP)/NP')
+        other.srl_annot.add(('_', 'A0', 'Y'))
+        self.assertTrue(other.srl_string()[2] is stag.srl_string()[2])
+        other.srl_annot.add(('Z', 'AM-TMP', '_'))
+        self.assertEqual(other.srl_string()[1],
+                         "(S[dcl]\\NP)/NP@X'A0'Y_Z'AM-TMP'X")
+
+    def test_srl_cache_bounded(self):
+        cache = ccg.scat._SRL_STRINGS
+        ccg.scat._SRL_STRINGS = ccg.scat._Cache(2)
+        try:
+            stags = [ccg.scat.SuperCat(s) for s in
+                     ('(S[dcl]\\NP)/NP', 'S[dcl]\\NP', 'NP/N', 'PP/NP')]
+            for stag in stags * 2:
+                self.assertEqual(stag.srl_annotated(),
+                                 stag.annotated.replace('<1>', '')
+                                 .replace('<2>', '') + '@')
+                self.assertTrue(len(ccg.scat._SRL_STRINGS) <= 2)
+        finally:
+            ccg.scat._SRL_STRINGS = cache
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,7 @@
+import random
 import unittest
 
+import ccg.category
 import ccg.rules
 import ccg.scat
 import ccg.lexicon
@@ -7,6 +9,28 @@ import Treebank.CCGbank
 
 ccg.lexicon.load()
 
+
+class _Word(object):
+    def __init__(self, text):
+        self.text = text
+
+
+def _replace_globals(scat):
+    """
+    global_annotated as it was: a replace over the string per variable
+    """
+    annotated = scat.annotated.replace('*}', '}')
+    handle = scat._vars.handle
+    for var in scat.cats_by_var:
+        global_vars = [handle(v) for v in scat._var_table[var]]
+        global_vars = [v for v in global_vars if v.word is not None]
+        global_vars = sorted(global_vars, key=lambda gv: gv.word)
+        global_str = '{%s}' % ','.join(str(v) for v in global_vars)
+        var_str = ccg.category.VARS[var]
+        annotated = annotated.replace('{%s}' % var_str, global_str)
+    return annotated
+
+
 class TestUnify(unittest.TestCase):
     def test_fapply_adjunct(self):
         c1 = ccg.scat.SuperCat('N/N')
@@ -52,6 +76,174 @@ class TestUnify(unittest.TestCase):
         self.assertEqual(plays.get_vars((plays.argument)),
                          elianti.get_vars(elianti))
 
+    def test_arena_sentence(self):
+        sent_str = ("(<T S[dcl] 0 2> (<T S[dcl] 1 2> (<T NP 0 1> "
+        "(<L NP/N NNP NNP Ms. NP_254/N_254>) (<L N NNP NNP Haag N>) ) (<T "
+        "S[dcl]\NP 0 2> (<L (S[dcl]\NP)/NP VBZ VBZ plays "
+        "(S[dcl]\NP_241)/NP_242>) (<L NP NNP NNP Elianti NP>) )"
+        " ) (<L . . . . .>) )")
+        sent = Treebank.CCGbank.CCGSentence(string=sent_str, globalID=0,
+                                            localID=0, arena=True)
+        sent.unify_vars()
+        ms, haag, plays, elianti, period = [w.stag for w in sent.listWords()]
+        self.assertEqual(ms._var_table[0], set([0]))
+        self.assertEqual(ms.get_vars(ms.argument), haag.get_vars(haag))
+        self.assertEqual(haag.get_vars(haag),
+                         plays.get_vars(plays.result.argument))
+        self.assertEqual(plays.global_annotated(),
+                         '((S[dcl]{plays}\NP{Haag}<1>){plays}/NP{Elianti}<2>)'
+                         '{plays}')
+        self.assertTrue(ccg.scat.active_arena() is None)
+        stags = [w.stag for w in sent.listWords()]
+        self.assertEqual(ccg.scat.global_annotations(stags),
+                         [stag.global_annotated() for stag in stags])
+        self.assertEqual(ccg.scat.global_annotations([ms])[0],
+                         '(NP{Haag}/N{Haag}<1>){Ms.}')
+
+    def test_arena_foreign_scat(self):
+        # A scat made outside the sentence's arena is moved into it
+        sent_str = ("(<T S[dcl] 0 2> (<T S[dcl] 1 2> (<T NP 0 1> "
+        "(<L NP/N NNP NNP Ms. NP_254/N_254>) (<L N NNP NNP Haag N>) ) (<T "
+        "S[dcl]\NP 0 2> (<L (S[dcl]\NP)/NP VBZ VBZ plays "
+        "(S[dcl]\NP_241)/NP_242>) (<L NP NNP NNP Elianti NP>) )"
+        " ) (<L . . . . .>) )")
+        sent = Treebank.CCGbank.CCGSentence(string=sent_str, globalID=0,
+                                            localID=0, arena=True)
+        sent.unify_vars()
+        ms, haag, plays, elianti, period = sent.listWords()
+        label = ccg.scat.SuperCat('N')
+        self.assertTrue(label._vars is ccg.scat.OBJECTS)
+        elianti.parent().changeLabel(label)
+        self.assertTrue(label._vars is sent.arena)
+        self.assertEqual(label.get_vars(),
+                         plays.stag.get_vars(plays.stag.argument))
+        self.assertEqual(label.global_annotated(), 'N{Elianti}')
+        # Words and unifications made before the move are kept
+        adjunct = ccg.scat.SuperCat(r'(S\NP)\(S\NP)')
+        adjunct.add_head(_Word('today'))
+        adjunct.unify_globals_at_var(adjunct, adjunct.result.var,
+                                     adjunct.var)
+        adjunct.share_globals(adjunct.argument.argument.var, plays.stag,
+                              plays.stag.result.argument.var)
+        self.assertTrue(adjunct._vars is sent.arena)
+        self.assertEqual(adjunct.global_annotated(),
+                         '((S[X]{today}\NP[Y]{Haag}){today}\('
+                         'S[X]{today}<1>\NP[Y]{Haag}){today}){today}')
+
+    def test_global_annotated_lexicon(self):
+        # Words named like variables, e.g. R, are replaced again by the
+        # old loop, and must still render the same
+        rng = random.Random(0)
+        words = [_Word(text) for text in ('Haag', 'plays', 'R', 'Y', '_')]
+        scats = []
+        for supertag in ccg.lexicon.CATS.supertags:
+            scat = ccg.scat.SuperCat(ccg.lexicon.CATS[supertag])
+            for var in scat._var_table:
+                if rng.random() < 0.5:
+                    for global_var in scat.var_globals(var):
+                        global_var.word = rng.choice(words)
+                elif rng.random() < 0.5:
+                    extra = ccg.scat.Variable()
+                    extra.word = rng.choice(words)
+                    scat.add_var(var, extra)
+            scats.append(scat)
+            if scat.is_complex:
+                scats.append(ccg.scat.change_kwarg(scat, conj=True))
+        for scat in scats:
+            self.assertEqual(scat.global_annotated(), _replace_globals(scat))
+        self.assertEqual(ccg.scat.global_annotations(scats),
+                         [_replace_globals(scat) for scat in scats])
+
+    def test_cats_at_global(self):
+        c1 = ccg.scat.SuperCat(r'(S[dcl]\NP)/NP')
+        c2 = ccg.scat.SuperCat('NP')
+        subject = c1.get_vars(c1.result.argument).pop()
+        self.assertEqual(c1.cats_at_global(subject), [c1.result.argument])
+        c1.unify_globals_at_var(c2, c1.argument.var, c2.var)
+        self.assertEqual(c1.cats_at_global(c2.get_vars().pop()),
+                         [c1.argument])
+        # Unifying through another scat is seen too
+        c3 = ccg.scat.SuperCat('NP')
+        c3.unify_globals_at_var(c1, c3.var, c1.result.argument.var)
+        self.assertEqual(c1.cats_at_global(c3.get_vars().pop()),
+                         [c1.result.argument])
+
+    def test_trial_rollback(self):
+        c1 = ccg.scat.SuperCat(r'(S[dcl]\NP)/NP')
+        c2 = ccg.scat.SuperCat('NP')
+        c2.add_head('Elianti')
+        with ccg.scat.trial():
+            c1.bind_vars(c2, c1.argument, c2.category)
+            self.assertEqual(c1.heads(c1.argument), ['Elianti'])
+        self.assertEqual(c1.heads(c1.argument), [])
+        self.assertFalse(c1.get_vars(c1.argument) == c2.get_vars())
+        with ccg.scat.trial() as trail:
+            c1.bind_vars(c2, c1.argument, c2.category)
+            trail.commit()
+        self.assertEqual(c1.heads(c1.argument), ['Elianti'])
+
+    def test_trial_compression(self):
+        # Paths are compressed in a trial, and restored on rollback
+        arena = ccg.scat.VariableArena()
+        a, b, c, d, e = [arena.new() for i in range(5)]
+        arena.union(a, b)
+        arena.union(c, d)
+        arena.union(a, c)
+        parents = list(arena.parents)
+        self.assertEqual(arena.parents[d], c)
+        with ccg.scat.trial():
+            arena.union(e, a)
+            self.assertEqual(arena.find(d), a)
+            self.assertEqual(arena.parents[d], a)
+        self.assertEqual(list(arena.parents), parents)
+        self.assertEqual(arena.find(e), e)
+        variables = [ccg.scat.Variable() for i in range(5)]
+        a, b, c, d, e = variables
+        a.unify(b)
+        c.unify(d)
+        a.unify(c)
+        refs = [v._ref for v in variables]
+        with ccg.scat.trial():
+            e.unify(a)
+            self.assertTrue(d.get_ref() is a)
+            self.assertTrue(d._ref is a)
+        self.assertEqual([v._ref for v in variables], refs)
+        self.assertEqual(d.val, c.val)
+
+    def test_shared_var_tables(self):
+        plays = ccg.scat.SuperCat(r'(S[dcl]\NP)/NP')
+        plays.add_head('plays')
+        conj = ccg.scat.change_kwarg(plays, conj=True)
+        self.assertTrue(conj._var_table[0] is plays._var_table[0])
+        self.assertEqual(conj.heads(), ['plays'])
+        # Adding a variable copies the set
+        other = ccg.scat.Variable()
+        conj.add_var(0, other)
+        self.assertEqual(len(conj._var_table[0]), 2)
+        self.assertEqual(len(plays._var_table[0]), 1)
+        conj.add_var(0, other)
+        self.assertEqual(len(conj._var_table[0]), 2)
+
+    def test_variable_sets(self):
+        variables = [ccg.scat.Variable() for i in range(6)]
+        first, second = variables[:2]
+        second.word = 'plays'
+        # Chain the variables, each under the next
+        for var, next_var in zip(variables, variables[1:]):
+            var.unify(next_var)
+            self.assertEqual(var.val, first.val)
+        self.assertEqual(len(set(variables)), 1)
+        self.assertTrue(all(v.word == 'plays' for v in variables))
+        root = variables[-1].get_ref()
+        self.assertTrue(all(v._ref is None or v._ref is root
+                            for v in variables))
+        # The first word set wins
+        other = ccg.scat.Variable()
+        other.word = 'Haag'
+        other.unify(first)
+        self.assertEqual(first.word, 'Haag')
+        self.assertEqual(first.val, other.val)
+
 
 if __name__ == '__main__':
     unittest.main()